@@ -0,0 +1,88 @@
+'''Sokoban state benchmark.
+    Measures, for each Sokoban state class, the memory taken by a state and the number of states
+    generated per second, by running a breadth-first search with full cycle checking over each of the
+    PROBLEMS and keeping every state it generates.
+
+    Run it with
+        python benchmark.py [max_states]
+    where max_states (default 20000) bounds the number of states generated per problem.
+'''
+
+import os
+import sys
+import gc
+import tracemalloc
+from collections import deque
+from sokoban import SokobanState, BitboardSokobanState, PooledSokobanState, PROBLEMS
+
+STATE_CLASSES = (SokobanState, BitboardSokobanState, PooledSokobanState)
+
+
+def convert(state, state_class):
+    '''@return: A problem state (one of PROBLEMS) in the representation of state_class.'''
+    if state_class is SokobanState:
+        return state
+    return state_class.from_state(state)
+
+
+def generate(initial_state, max_states):
+    '''
+    Breadth-first search from initial_state with full cycle checking.
+    @return: The list of the (distinct) states generated, at most max_states of them.
+    '''
+    seen = {initial_state.hashable_state()}
+    states = [initial_state]
+    queue = deque(states)
+    while queue and len(states) < max_states:
+        for succ in queue.popleft().successors():
+            hash_state = succ.hashable_state()
+            if hash_state not in seen:
+                seen.add(hash_state)
+                states.append(succ)
+                queue.append(succ)
+    return states
+
+
+def measure(initial_state, max_states):
+    '''
+    @return: The number of states generated, the bytes allocated per state (states and the states they
+             keep alive, not counting the cycle checking set) and the states generated per second.
+    '''
+    gc.collect()
+    start = os.times()[0]
+    states = generate(initial_state, max_states)
+    elapsed = os.times()[0] - start
+
+    gc.collect()
+    tracemalloc.start()
+    states = generate(initial_state, max_states)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(states), size / len(states), len(states) / max(elapsed, 1e-9)
+
+
+def benchmark(problems=PROBLEMS, state_classes=STATE_CLASSES, max_states=20000):
+    '''
+    @return: A list with, for each state class, a tuple of its name, the total number of states generated,
+             the average bytes per state and the states generated per second over all the problems.
+    '''
+    results = []
+    for state_class in state_classes:
+        total_states = 0
+        total_bytes = 0
+        total_time = 0
+        for problem in problems:
+            count, state_bytes, rate = measure(convert(problem, state_class), max_states)
+            total_states += count
+            total_bytes += state_bytes * count
+            total_time += count / rate
+        results.append((state_class.__name__, total_states, total_bytes / total_states, total_states / total_time))
+    return results
+
+
+if __name__ == '__main__':
+    max_states = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("{:<24}{:>10}{:>16}{:>16}".format("state class", "states", "bytes/state", "states/second"))
+    for name, states, state_bytes, rate in benchmark(max_states=max_states):
+        print("{:<24}{:>10}{:>16.1f}{:>16.0f}".format(name, states, state_bytes, rate))
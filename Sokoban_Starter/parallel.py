@@ -0,0 +1,150 @@
+'''Parallel Sokoban solving routines.
+    A) solve_batch
+    Solves a list of Sokoban problems on a pool of worker processes, one problem per task, streaming
+    back each result as soon as it is available.
+    B) solve_portfolio
+    Races several (algorithm, heuristic, weight) configurations on the same problem, one process each,
+    and returns the first (or best) solution together with the configuration that found it.
+
+    Each task runs one of the search algorithms of solution.py (weighted_astar, iterative_astar or
+    iterative_gbfs). Tasks of solve_batch have their own timebound, measured from the moment the task
+    starts running, while the processes of solve_portfolio share one deadline of the (system wide)
+    monotonic clock, see search_deadline. Heuristics must be picklable, i.e. module level functions
+    such as heur_alternate, not lambdas.
+'''
+
+import os
+import time
+import queue
+import multiprocessing
+from solution import weighted_astar, iterative_astar, iterative_gbfs, heur_alternate, heur_min_matching
+from search import search_deadline
+from sokoban import PROBLEMS
+
+ALGORITHMS = ('weighted_astar', 'iterative_astar', 'iterative_gbfs')
+
+# (algorithm, heuristic, weight) configurations raced by solve_portfolio by default
+DEFAULT_PORTFOLIO = (
+    ('iterative_astar', heur_alternate, 10),
+    ('iterative_gbfs', heur_alternate, None),
+    ('weighted_astar', heur_alternate, 5),
+    ('weighted_astar', heur_min_matching, 2),
+)
+
+
+def solve(initial_state, algorithm='iterative_astar', heur_fn=heur_alternate, weight=10, timebound=2, deadline=None):
+    '''
+    Runs one of the search algorithms of solution.py on a problem.
+    @param initial_state: The Sokoban state to solve.
+    @param algorithm: One of ALGORITHMS.
+    @param heur_fn: The heuristic function.
+    @param weight: The (initial) weight, ignored by iterative_gbfs.
+    @param timebound: The number of seconds the search may take.
+    @param deadline: An optional deadline (see search_deadline) that the search must also meet.
+    @return: The goal state (or False) and the SearchStats of the search.
+    '''
+    if algorithm == 'weighted_astar':
+        return weighted_astar(initial_state, heur_fn, weight, timebound, deadline)
+    if algorithm == 'iterative_astar':
+        return iterative_astar(initial_state, heur_fn, weight, timebound, deadline)
+    if algorithm == 'iterative_gbfs':
+        return iterative_gbfs(initial_state, heur_fn, timebound, deadline)
+    raise ValueError("Unknown algorithm {}, must be one of {}".format(algorithm, ALGORITHMS))
+
+
+def solve_batch(problems, algorithm='iterative_astar', heur_fn=heur_alternate, weight=10, timebound=2,
+                max_workers=None):
+    '''
+    Solves problems in parallel on a process pool.
+    @param problems: A sequence of Sokoban states.
+    @param algorithm: One of ALGORITHMS, used for every problem.
+    @param heur_fn: The heuristic function (must be picklable).
+    @param weight: The (initial) weight, ignored by iterative_gbfs.
+    @param timebound: The number of seconds each problem may take once its task has started.
+    @param max_workers: The number of worker processes, defaults to the number of CPUs.
+    @return: A generator of (problem_index, solution_state, SearchStats) tuples, in completion order.
+             solution_state is False if the problem was not solved within the timebound.
+
+    Closing the generator (or simply no longer iterating over it, e.g. breaking out of a for loop)
+    cancels the problems that have not finished yet and stops the worker processes.
+    '''
+    if algorithm not in ALGORITHMS:
+        raise ValueError("Unknown algorithm {}, must be one of {}".format(algorithm, ALGORITHMS))
+
+    # a Pool rather than a ProcessPoolExecutor: only a Pool can stop the tasks that are running
+    pool = multiprocessing.Pool(processes=max_workers)
+    try:
+        tasks = [(i, problem, algorithm, heur_fn, weight, timebound) for i, problem in enumerate(problems)]
+        for result in pool.imap_unordered(_batch_worker, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _batch_worker(task):
+    '''Solves one (problem_index, problem, algorithm, heur_fn, weight, timebound) task of solve_batch.'''
+    i, problem, algorithm, heur_fn, weight, timebound = task
+    final, stats = solve(problem, algorithm, heur_fn, weight, timebound)
+    return i, final, stats
+
+
+def _portfolio_worker(results, index, initial_state, config, deadline):
+    '''Runs one portfolio configuration and reports (index, solution_state, SearchStats) on results.'''
+    algorithm, heur_fn, weight = config
+    final, stats = solve(initial_state, algorithm, heur_fn, weight, None, deadline)
+    results.put((index, final, stats))
+
+
+def solve_portfolio(initial_state, configs=DEFAULT_PORTFOLIO, timebound=2, first=True):
+    '''
+    Races several search configurations on the same problem, each in its own process.
+    @param initial_state: The Sokoban state to solve.
+    @param configs: A sequence of (algorithm, heur_fn, weight) tuples, see solve for their meaning.
+    @param timebound: The number of seconds the whole portfolio may take.
+    @param first: If True, return as soon as any configuration finds a solution. Otherwise wait for
+                  every configuration (or the timebound) and return the cheapest solution.
+    @return: The solution state (or False), its SearchStats and the winning configuration
+             (None, None if nothing was solved). The processes that are still running are terminated.
+    '''
+    deadline = search_deadline(timebound)
+    # leave the workers time to send their solution back before the deadline
+    worker_deadline = deadline - min(0.1 * timebound, 0.25)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_portfolio_worker,
+                                         args=(results, i, initial_state, config, worker_deadline), daemon=True)
+                 for i, config in enumerate(configs)]
+    best = (False, None, None)
+    try:
+        for process in processes:
+            process.start()
+        for _ in processes:
+            time_left = deadline - time.monotonic()
+            if time_left <= 0:
+                break
+            try:
+                index, final, stats = results.get(timeout=time_left)
+            except queue.Empty:
+                break
+            if final and (not best[0] or final.gval < best[0].gval):
+                best = (final, stats, configs[index])
+                if first:
+                    break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            if process.pid is not None:
+                process.join()
+        results.close()
+    return best
+
+
+if __name__ == '__main__':
+    solved = 0
+    for i, final, stats in solve_batch(PROBLEMS, timebound=2):
+        if final:
+            solved += 1
+        print("PROBLEM {}: {}".format(i, "cost {}".format(final.gval) if final else "unsolved"))
+    print("Solved {} of {} problems on {} CPUs.".format(solved, len(PROBLEMS), os.cpu_count()))
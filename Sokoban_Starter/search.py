@@ -38,12 +38,22 @@
 
     '''
 import heapq
+import json
 from collections import deque
+from array import array
+import functools
+import gc
+import math
 import os
+import threading
+import time
 
 
 class StateSpace:
-    '''Abstract class for defining State spaces for search routines'''
+    '''Abstract class for defining State spaces for search routines.
+       The data items are slots, so subclasses that declare __slots__
+       for their own data items have no per-state __dict__.'''
+    __slots__ = ('action', 'gval', 'parent', 'index')
     n = 0
 
     def __init__(self, action, gval, parent):
@@ -125,6 +135,7 @@ _BEST_FIRST = 2
 _ASTAR = 3
 _UCS = 4
 _CUSTOM = 5
+_IDA_STAR = 6
 
 # For best first and astar we use a priority queue. This requires
 # a comparison function for nodes. These constants indicate if we use
@@ -141,6 +152,25 @@ _CC_NONE = 0
 _CC_PATH = 1
 _CC_FULL = 2
 
+# Priority queue used for OPEN by the priority based strategies. Either
+# OPEN_HEAP 'heap' (a heapq list; cheaper re-discoveries of a state are added
+# as duplicates and stale copies are skipped when extracted) or OPEN_INDEXED
+# 'indexed' (an indexed binary heap holding at most one node per state, where a
+# cheaper re-discovery decreases the key of the node already on OPEN) or
+# OPEN_BUCKET 'bucket' (one LIFO bucket per priority value, meant for the small
+# integer g, h and f values of unit cost problems).
+_OPEN_HEAP = 0
+_OPEN_INDEXED = 1
+_OPEN_BUCKET = 2
+
+# Storage of the g-values remembered by full cycle checking. Either
+# CLOSED_DICT 'dict' (a dictionary from hashable_state to g-value) or
+# CLOSED_COMPACT 'compact' (a CompactClosedTable, which takes about a third
+# of the memory but needs 64-bit integer state keys, e.g. Zobrist hashes,
+# and non-negative integer g-values below 2**32).
+_CLOSED_DICT = 0
+_CLOSED_COMPACT = 1
+
 
 # Zero Heuristic Function---for uninformed search don't include heur_fn
 # in call to search engine's search method, defaults heur_fn to the zero fn.
@@ -149,6 +179,139 @@ def _zero_hfn(state):
     return 0
 
 
+# Default number of states remembered by the transposition table of IDA*
+# (see SearchEngine.transposition_size). Once it is full IDA* still only
+# needs memory linear in the solution depth.
+_TRANSPOSITION_SIZE = 1 << 20
+
+
+# Deadlines are times of time.monotonic(), the wall clock every timebound is
+# measured on (see search_deadline). A search reads the clock after at most
+# _DEADLINE_CHECK_INTERVAL generated states, more often when its deadline is
+# near, and stops _DEADLINE_SLACK seconds before the deadline, plus the time
+# it needs to free its tables (see _TEARDOWN_TIME), so that it has returned
+# its result by then (see SearchEngine.deadline_slack).
+_DEADLINE_CHECK_INTERVAL = 1000
+_DEADLINE_SLACK = 0.005
+
+# A search with a deadline runs with Python's cyclic garbage collector
+# paused: a collection over the millions of objects a search allocates can
+# stop it for much longer than _DEADLINE_SLACK. Nodes and states form no
+# reference cycles, so they are still freed as soon as they are dropped.
+# The collector is resumed when the last such search of the process has
+# returned, if it was enabled when the first one started. The objects
+# allocated in the meantime are then moved to the oldest generation (by
+# gc.freeze and gc.unfreeze, unless the program froze objects itself), as
+# otherwise the caller's next allocation would start a collection of them all.
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+def _pause_gc():
+    global _gc_pauses, _gc_was_enabled
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses = _gc_pauses + 1
+
+
+def _resume_gc():
+    global _gc_pauses
+    with _gc_lock:
+        _gc_pauses = _gc_pauses - 1
+        if _gc_pauses == 0 and _gc_was_enabled:
+            if gc.get_freeze_count() == 0:
+                gc.freeze()
+                gc.unfreeze()
+            gc.enable()
+
+
+def _timed_search(search_method):
+    '''Decorates the searches that call start_clock, so that the garbage collector is resumed however they return'''
+    @functools.wraps(search_method)
+    def search(self, *args, **kwargs):
+        try:
+            return search_method(self, *args, **kwargs)
+        finally:
+            if self.gc_paused:
+                self.gc_paused = False
+                _resume_gc()
+    return search
+
+
+def search_deadline(timebound=None, deadline=None):
+    '''
+    The deadline of a search that may take timebound seconds from now and
+    must also end by deadline (either may be None, for no bound). Nested
+    calls pass the deadline down so that they all end by the same time.
+    '''
+    if timebound:
+        timebound_deadline = time.monotonic() + timebound
+        if deadline is None or timebound_deadline < deadline:
+            return timebound_deadline
+    return deadline
+
+
+# Estimated time (seconds per entry of its best g-value table and heap) that
+# the anytime search needs after it stops to re-prioritize OPEN and to free
+# its tables, and the bidirectional search to free its visited and meet
+# tables. The search stops that much before its timebound so that the
+# caller gets control back in time. _TEARDOWN_TIME is only the first estimate:
+# every such search with at least _TEARDOWN_SAMPLE entries times how long
+# freeing its tables takes, and the engine's teardown_time becomes
+# _TEARDOWN_MARGIN times that if it is higher, or else decays by
+# _TEARDOWN_DECAY towards it.
+_TEARDOWN_TIME = 2e-6
+_TEARDOWN_SAMPLE = 10000
+_TEARDOWN_MARGIN = 2
+_TEARDOWN_DECAY = 0.9
+
+# Default number of expansions between two calls of the progress function
+# (see SearchEngine.set_progress).
+_PROGRESS_INTERVAL = 10000
+
+
+class CancellationToken:
+    '''Lets another thread (or a signal handler) stop a running search.
+       Give the token to SearchEngine.set_cancel_token; once cancel() is
+       called the search returns at its next check (within
+       deadline_check_interval generated states), as if its time had run
+       out. The anytime search still returns its best solution so far.'''
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IncrementalHeuristic:
+    '''A heuristic that can be evaluated from the value at the parent
+       state. initial(state) evaluates a state from scratch and returns
+       its h-value together with any information (e.g. the assignment
+       of boxes to storage points) that helps evaluate its successors.
+       update(state, parent, parent_info) does the same for a successor
+       of parent, given the information initial or update returned for
+       parent; it only needs to account for what the move changed.
+
+       When the heur_fn given to init_search is an IncrementalHeuristic
+       the SearchEngine keeps the information of each node in its hinfo
+       attribute and calls update for every successor. Instances are
+       callable, so they can also be used wherever a plain heuristic
+       function is expected.'''
+
+    def __call__(self, state):
+        return self.initial(state)[0]
+
+    def initial(self, state):
+        raise Exception("Must be overridden in subclass.")
+
+    def update(self, state, parent, parent_info):
+        return self.initial(state)
+
+
 def _fval_function(state):
     '''default fval function results in Best First Search'''
     return state.hval
@@ -156,15 +319,175 @@ def _fval_function(state):
 
 class SearchStats:
 
-    def __init__(self, n1, n2, n3, n4, n5):
+    def __init__(self, n1, n2, n3, n4, n5, n6=0, n7=0):
         self.states_expanded = n1
         self.states_generated = n2
         self.states_pruned_cycles = n3
         self.states_pruned_cost = n4
         self.total_time = n5
+        self.states_pruned_deadlock = n6
+        self.nodes_dropped_memory = n7
 
     def __str__(self):
-        return f'states generated: {self.states_generated}\nstates explored: {self.states_expanded}\nstate pruned by cycle checking: {self.states_pruned_cycles}\nstates pruned by cost checking: {self.states_pruned_cost}\ntotal search time: {self.total_time}\n'
+        return f'states generated: {self.states_generated}\nstates explored: {self.states_expanded}\nstate pruned by cycle checking: {self.states_pruned_cycles}\nstates pruned by cost checking: {self.states_pruned_cost}\nstates pruned by deadlock checking: {self.states_pruned_deadlock}\nnodes dropped by the memory bound: {self.nodes_dropped_memory}\ntotal search time: {self.total_time}\n'
+
+
+class SearchProgress:
+    '''What the progress function of a SearchEngine is called with: the
+       f-value of the node being expanded (None for the bidirectional
+       search), the size of OPEN and of the closed (cycle checking or
+       transposition) table, the expansions per second since the last
+       report and the best solution found so far (anytime search only).'''
+
+    def __init__(self, expanded, generated, best_f, open_size, closed_size, expansion_rate, incumbent, elapsed):
+        self.states_expanded = expanded
+        self.states_generated = generated
+        self.best_f = best_f
+        self.open_size = open_size
+        self.closed_size = closed_size
+        self.expansion_rate = expansion_rate
+        self.incumbent = incumbent
+        self.elapsed_time = elapsed
+
+    def __str__(self):
+        incumbent = self.incumbent.gval if self.incumbent else None
+        return f'expanded: {self.states_expanded} generated: {self.states_generated} best f: {self.best_f} OPEN: {self.open_size} closed: {self.closed_size} expansions/s: {self.expansion_rate:.0f} incumbent cost: {incumbent} time: {self.elapsed_time:.3f}'
+
+
+class SearchTelemetry:
+    '''Where the time of a search goes. Give an instance to
+       SearchEngine.set_telemetry; every search of the engine then adds to
+       it (call reset() to start over):
+         phase_time, phase_calls: seconds spent in and number of calls of
+             each of the PHASES (successor generation, heuristic evaluation,
+             pushing, popping and memory-bound pruning of OPEN, and cycle
+             checking lookups, including the hashing of the states)
+         f_histogram, g_histogram, h_histogram: value -> number of
+             expansions of nodes with that f, g and h-value
+         peak_open, peak_closed: the largest OPEN and closed (cycle
+             checking or transposition) table seen at an expansion
+         solutions: (seconds since the search started, cost) of each
+             solution found, so that of the first solution for the anytime
+             search
+       Phases are timed with time.perf_counter (see timing), and only while
+       telemetry is on; a search without telemetry enters a context that
+       does nothing instead.'''
+
+    PHASES = ('successors', 'heuristic', 'open', 'cycle_check')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.strategy = None
+        self.search_time = 0.0
+        self.start_time = None
+        self.expansions = 0
+        self.phase_time = dict.fromkeys(self.PHASES, 0.0)
+        self.phase_calls = dict.fromkeys(self.PHASES, 0)
+        self.f_histogram = dict()
+        self.g_histogram = dict()
+        self.h_histogram = dict()
+        self.peak_open = 0
+        self.peak_closed = 0
+        self.solutions = []
+
+    def start(self, strategy):
+        '''Called by the SearchEngine when a search starts'''
+        self.strategy = strategy
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        '''Called by the SearchEngine when a search returns'''
+        self.search_time = self.search_time + time.perf_counter() - self.start_time
+
+    def add_time(self, phase, seconds):
+        self.phase_time[phase] = self.phase_time[phase] + seconds
+        self.phase_calls[phase] = self.phase_calls[phase] + 1
+
+    def timing(self, phase):
+        '''A context manager adding the time spent in its block to phase'''
+        return _PhaseTiming(self, phase)
+
+    def expanded(self, gval, hval, open_size, closed_size):
+        '''Record the expansion of a node, with the sizes of OPEN and the closed table at that time'''
+        self.expansions = self.expansions + 1
+        fval = gval + hval
+        self.f_histogram[fval] = self.f_histogram.get(fval, 0) + 1
+        self.g_histogram[gval] = self.g_histogram.get(gval, 0) + 1
+        self.h_histogram[hval] = self.h_histogram.get(hval, 0) + 1
+        if open_size > self.peak_open:
+            self.peak_open = open_size
+        if closed_size > self.peak_closed:
+            self.peak_closed = closed_size
+
+    def solution(self, cost):
+        self.solutions.append((time.perf_counter() - self.start_time, cost))
+
+    def first_solution_time(self):
+        '''Seconds from the start of the search to its first solution, None if there was none'''
+        return self.solutions[0][0] if self.solutions else None
+
+    def as_dict(self):
+        return {'strategy': self.strategy,
+                'search_time': self.search_time,
+                'expansions': self.expansions,
+                'phase_time': dict(self.phase_time),
+                'phase_calls': dict(self.phase_calls),
+                'f_histogram': {str(k): v for k, v in sorted(self.f_histogram.items())},
+                'g_histogram': {str(k): v for k, v in sorted(self.g_histogram.items())},
+                'h_histogram': {str(k): v for k, v in sorted(self.h_histogram.items())},
+                'peak_open': self.peak_open,
+                'peak_closed': self.peak_closed,
+                'first_solution_time': self.first_solution_time(),
+                'solutions': [list(solution) for solution in self.solutions]}
+
+    def write_json(self, file, **fields):
+        '''
+        Write the telemetry as one line of JSON to file (a file object open
+        for writing), after the given fields, e.g. write_json(f, problem=3).
+        '''
+        record = dict(fields)
+        record.update(self.as_dict())
+        file.write(json.dumps(record) + '\n')
+
+    def __str__(self):
+        phases = ' '.join('{}: {:.3f}s/{}'.format(phase, self.phase_time[phase], self.phase_calls[phase])
+                          for phase in self.PHASES)
+        return f'{phases}\npeak OPEN: {self.peak_open} peak closed: {self.peak_closed}\nfirst solution after: {self.first_solution_time()}\nsearch time: {self.search_time}\n'
+
+
+class _PhaseTiming:
+    '''The context manager of SearchTelemetry.timing'''
+    __slots__ = ('telemetry', 'phase', 'started')
+
+    def __init__(self, telemetry, phase):
+        self.telemetry = telemetry
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.telemetry.add_time(self.phase, time.perf_counter() - self.started)
+
+
+class _Untimed:
+    '''The context manager timing the phases of a search without telemetry: it does nothing'''
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_UNTIMED = _Untimed()
+
+
+def _untimed(phase):
+    return _UNTIMED
 
 
 class sNode:
@@ -172,18 +495,28 @@ class sNode:
     node consists of a search space object (determined by the problem
     definition) along with the h and g values (the g values is
     redundant as it is stored in the state, but we make a copy in the
-    node object for convenience), and the number of the node'''
+    node object for convenience), and the number of the node.
+
+    The SearchEngine numbers its own nodes and orders OPEN with its own
+    keys, so searches never share state through this class. The class
+    counter and lt_type are only defaults for nodes created directly.'''
 
     n = 0
     lt_type = _SUM_HG
 
-    def __init__(self, state, hval, fval_function):
+    def __init__(self, state, hval, fval_function, index=None, lt_type=None, hinfo=None):
         self.state = state
         self.hval = hval
+        # what an IncrementalHeuristic needs to evaluate the successors
+        self.hinfo = hinfo
         self.gval = state.gval
-        self.index = sNode.n
+        if index is None:
+            index = sNode.n
+            sNode.n = sNode.n + 1
+        self.index = index
         self.fval_function = fval_function
-        sNode.n = sNode.n + 1
+        if lt_type is not None:
+            self.lt_type = lt_type
 
     def __lt__(self, other):
         '''For astar and best first we use a priority queue for the
@@ -197,17 +530,17 @@ class sNode:
            value. This means that we expand nodes along deeper paths
            first causing the search to proceed directly to the goal'''
 
-        if sNode.lt_type == _SUM_HG:
+        if self.lt_type == _SUM_HG:
             if (self.gval + self.hval) == (other.gval + other.hval):
                 # break ties by greatest gval.
                 return self.gval > other.gval
             else:
                 return ((self.gval + self.hval) < (other.gval + other.hval))
-        if sNode.lt_type == _G:
+        if self.lt_type == _G:
             return self.gval < other.gval
-        if sNode.lt_type == _H:
+        if self.lt_type == _H:
             return self.hval < other.hval
-        if sNode.lt_type == _C:
+        if self.lt_type == _C:
             return self.fval_function(self) < other.fval_function(other)
 
         print('sNode class has invalid comparator setting!')
@@ -216,6 +549,251 @@ class sNode:
         return self.gval < other.gval
 
 
+class IndexedHeap:
+    '''A binary min-heap of search nodes indexed by hashable_state, so that it
+       holds at most one node per state. Inserting a node for a state that is
+       already on the heap keeps whichever of the two has the lower g-value,
+       or the lower key for equal g-values (decrease-key), moving it up or
+       down the heap as needed. Nodes are
+       stored as key(node) + (node,) entries and ordered by their keys.'''
+
+    def __init__(self, key):
+        self.key = key
+        self.heap = []
+        # hashable_state -> position of its entry in self.heap
+        self.position = dict()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[-1] for entry in self.heap)
+
+    def insert(self, node):
+        state_key = node.state.hashable_state()
+        i = self.position.get(state_key)
+        if i is None:
+            self.heap.append(self.key(node) + (node,))
+            self.position[state_key] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+        else:
+            old = self.heap[i]
+            entry = self.key(node) + (node,)
+            if node.gval < old[-1].gval or node.gval == old[-1].gval and entry < old:
+                self.heap[i] = entry
+                self._sift_down(self._sift_up(i))
+
+    def extract(self):
+        heap = self.heap
+        node = heap[0][-1]
+        del self.position[node.state.hashable_state()]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            self.position[last[-1].state.hashable_state()] = 0
+            self._sift_down(0)
+        return node
+
+    def prune(self, keep):
+        '''Keeps the keep best nodes and returns the others (a sorted list is a heap already)'''
+        heap = self.heap
+        heap.sort()
+        dropped = [entry[-1] for entry in heap[keep:]]
+        del heap[keep:]
+        self.position = {entry[-1].state.hashable_state(): i for i, entry in enumerate(heap)}
+        return dropped
+
+    def _move(self, entry, i):
+        self.heap[i] = entry
+        self.position[entry[-1].state.hashable_state()] = i
+
+    def _sift_up(self, i):
+        '''Move the entry at position i towards the root, returns its new position'''
+        heap = self.heap
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not entry < heap[parent]:
+                break
+            self._move(heap[parent], i)
+            i = parent
+        self._move(entry, i)
+        return i
+
+    def _sift_down(self, i):
+        '''Move the entry at position i towards the leaves, returns its new position'''
+        heap = self.heap
+        entry = heap[i]
+        size = len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child = child + 1
+            if not heap[child] < entry:
+                break
+            self._move(heap[child], i)
+            i = child
+        self._move(entry, i)
+        return i
+
+
+class BucketQueue:
+    '''A priority queue keeping one LIFO bucket of nodes per priority value.
+       Priorities are plain numbers or tuples of numbers (e.g. (f, -g) for
+       astar) computed once when a node is inserted, so nodes are never
+       compared with each other. Only the distinct priority values are kept
+       in a heap; with unit action costs there are few of them, making
+       insert and extract effectively constant time.'''
+
+    def __init__(self, priority):
+        self.priority = priority
+        # priority value -> list of nodes with that priority
+        self.buckets = dict()
+        # heap of the priority values that have a non-empty bucket
+        self.keys = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for key in sorted(self.keys):
+            yield from reversed(self.buckets[key])
+
+    def insert(self, node):
+        key = self.priority(node)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = []
+            heapq.heappush(self.keys, key)
+        bucket.append(node)
+        self.size = self.size + 1
+
+    def extract(self):
+        key = self.keys[0]
+        bucket = self.buckets[key]
+        node = bucket.pop()
+        if not bucket:
+            del self.buckets[key]
+            heapq.heappop(self.keys)
+        self.size = self.size - 1
+        return node
+
+    def prune(self, keep):
+        '''Keeps the keep best nodes (the last ones of the lowest buckets) and returns the others'''
+        self.keys.sort()
+        dropped = []
+        kept = 0
+        for i, key in enumerate(self.keys):
+            bucket = self.buckets[key]
+            if kept + len(bucket) <= keep:
+                kept = kept + len(bucket)
+                continue
+            cut = len(bucket) - (keep - kept)
+            dropped.extend(bucket[:cut])
+            del bucket[:cut]
+            kept = keep
+            for key in self.keys[i + 1:]:
+                dropped.extend(self.buckets.pop(key))
+            del self.keys[i + 1:]
+            if not bucket:
+                del self.buckets[self.keys.pop()]
+            break
+        self.size = kept
+        return dropped
+
+
+class CompactClosedTable:
+    '''A hash table from 64-bit integer keys (e.g. hashable_state values) to
+       small integer g-values, stored in two flat arrays with open addressing
+       and linear probing. It supports the dictionary operations used by
+       cycle checking (in, [], get, []= and len) in much less memory than a
+       dict, at the price of slower inserts and lookups. Keys are reduced to 64 bits, so
+       two states are confused only if their keys collide. A zero in the key
+       array marks an empty slot, so the g-value of the key 0 is kept apart
+       in zero_gval.'''
+
+    _KEY_MASK = (1 << 64) - 1
+
+    def __init__(self, capacity=1 << 16):
+        size = 1
+        while size < 2 * capacity:
+            size = size << 1
+        self.keys = array('Q', bytes(8 * size))
+        self.gvals = array('I', bytes(4 * size))
+        self.mask = size - 1
+        self.size = 0
+        self.zero_gval = None
+
+    def __len__(self):
+        return self.size
+
+    def _slot(self, key):
+        '''Returns the slot holding the (non-zero, 64-bit) key, or the empty slot where it would go'''
+        keys = self.keys
+        mask = self.mask
+        i = key & mask
+        stored = keys[i]
+        while stored != key and stored:
+            i = (i + 1) & mask
+            stored = keys[i]
+        return i
+
+    def __contains__(self, key):
+        key = key & self._KEY_MASK
+        if not key:
+            return self.zero_gval is not None
+        return self.keys[self._slot(key)] == key
+
+    def __getitem__(self, key):
+        gval = self.get(key)
+        if gval is None:
+            raise KeyError(key)
+        return gval
+
+    def get(self, key, default=None):
+        key = key & self._KEY_MASK
+        if not key:
+            return default if self.zero_gval is None else self.zero_gval
+        i = self._slot(key)
+        if self.keys[i] != key:
+            return default
+        return self.gvals[i]
+
+    def __setitem__(self, key, gval):
+        key = key & self._KEY_MASK
+        if not key:
+            if self.zero_gval is None:
+                self.size = self.size + 1
+            self.zero_gval = gval
+            return
+        i = self._slot(key)
+        self.gvals[i] = gval
+        if not self.keys[i]:
+            self.keys[i] = key
+            self.size = self.size + 1
+            if 2 * self.size > len(self.keys):
+                self._grow()
+
+    def _grow(self):
+        '''Doubles the number of slots, keeping the table at most half full'''
+        keys, gvals = self.keys, self.gvals
+        size = 2 * len(keys)
+        self.keys = array('Q', bytes(8 * size))
+        self.gvals = array('I', bytes(4 * size))
+        self.mask = size - 1
+        new_keys, new_gvals, mask = self.keys, self.gvals, self.mask
+        for key, gval in zip(keys, gvals):
+            if key:
+                i = key & mask
+                while new_keys[i]:
+                    i = (i + 1) & mask
+                new_keys[i] = key
+                new_gvals[i] = gval
+
+
 class Open:
     '''Open objects hold the search frontier---the set of unexpanded
        nodes. Depending on the search strategy used we want to extract
@@ -223,74 +801,194 @@ class Open:
        functions to operate as needed by the particular search
        strategy'''
 
-    def __init__(self, search_strategy):
-        if search_strategy == _DEPTH_FIRST:
+    def __init__(self, search_strategy, open_type=_OPEN_HEAP):
+        self.search_strategy = search_strategy
+        self.open_type = open_type
+        self.key = None
+        if search_strategy == _DEPTH_FIRST or search_strategy == _IDA_STAR:
             # use stack for OPEN set (last in---most recent successor added---is first out)
-            self.open = []
-            self.insert = self.open.append
-            self.extract = self.open.pop
+            # (IDA* only keeps its root on OPEN and runs its own depth-first iterations)
+            stack = self.open = []
+            self.insert = stack.append
+            self.extract = stack.pop
+            self.nodes = lambda: list(stack)
+            return
         elif search_strategy == _BREADTH_FIRST:
             # use queue for OPEN (first in---earliest node not yet expanded---is first out)
-            self.open = deque()
-            self.insert = self.open.append
-            self.extract = self.open.popleft
+            queue = self.open = deque()
+            self.insert = queue.append
+            self.extract = queue.popleft
+            self.nodes = lambda: list(queue)
+            return
+
+        # For the other strategies OPEN is a priority queue. Each node's
+        # priority is computed once, when it is inserted, as a key tuple
+        # ending with the node's unique index (e.g. (f, -g, index)), so
+        # ordering nodes is a plain tuple comparison and never calls
+        # sNode.__lt__ or the fval function again.
         elif search_strategy == _UCS:
-            # use priority queue for OPEN (first out is node with lowest gval)
-            self.open = []
-            # set node less than function to compare gvals only
-            sNode.lt_type = _G
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            # first out is node with lowest gval
+            key = lambda node: (node.gval, node.index)
         elif search_strategy == _BEST_FIRST:
-            # use priority queue for OPEN (first out is node with lowest hval)
-            self.open = []
-            # set node less than function to compare hvals only
-            sNode.lt_type = _H
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            # first out is node with lowest hval
+            key = lambda node: (node.hval, node.index)
         elif search_strategy == _ASTAR:
-            # use priority queue for OPEN (first out is node with lowest fval = gval+hval)
-            self.open = []
-            # set node less than function to compare sums of hval and gval
-            sNode.lt_type = _SUM_HG
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            # first out is node with lowest fval = gval+hval, ties broken by greatest gval
+            key = lambda node: (node.gval + node.hval, -node.gval, node.index)
         elif search_strategy == _CUSTOM:
-            # use priority queue for OPEN (first out is node with lowest fval)
-            self.open = []
-            # set node less than function to compare sums of fval
-            sNode.lt_type = _C
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            # first out is node with lowest fval, ties broken by greatest gval
+            key = lambda node: (node.fval_function(node), -node.gval, node.index)
+        self.key = key
+
+        # (the functions refer to the container, not to self, so that an Open
+        # is freed as soon as it is dropped rather than by the garbage collector)
+        if open_type == _OPEN_INDEXED:
+            # same ordering, but without duplicate states on OPEN
+            indexed = self.open = IndexedHeap(key)
+            self.insert = indexed.insert
+            self.extract = indexed.extract
+            self.nodes = lambda: list(indexed)
+        elif open_type == _OPEN_BUCKET:
+            # same ordering, one bucket per priority (the key without the index)
+            buckets = self.open = BucketQueue(lambda node: key(node)[:-1])
+            self.insert = buckets.insert
+            self.extract = buckets.extract
+            self.nodes = lambda: list(buckets)
+        else:
+            # heap entries are key + (node,) tuples
+            heap = self.open = []
+            self.insert = lambda node: heapq.heappush(heap, key(node) + (node,))
+            self.extract = lambda: heapq.heappop(heap)[-1]
+            self.nodes = lambda: [entry[-1] for entry in heap]
 
     def empty(self):
         return not self.open
 
+    def __len__(self):
+        return len(self.open)
+
+    def prune(self, keep):
+        '''Keeps the keep best nodes (by the strategy's priority) and returns the others'''
+        if self.open_type == _OPEN_INDEXED or self.open_type == _OPEN_BUCKET:
+            return self.open.prune(keep)
+        # the sorted entries are a heap already
+        self.open.sort()
+        dropped = [entry[-1] for entry in self.open[keep:]]
+        del self.open[keep:]
+        return dropped
+
     def print_open(self):
         print("{", end="")
-        if len(self.open) == 1:
-            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(self.open[0].state.index, self.open[0].state.action,
-                                                                self.open[0].state.hashable_state(), self.open[0].gval,
-                                                                self.open[0].hval,
-                                                                self.open[0].gval + self.open[0].hval), end="")
-        else:
-            for nd in self.open:
-                print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action,
-                                                                    nd.state.hashable_state(), nd.gval, nd.hval,
-                                                                    nd.gval + nd.hval), end="")
+        for nd in self.nodes():
+            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action,
+                                                                nd.state.hashable_state(), nd.gval, nd.hval,
+                                                                nd.gval + nd.hval), end="")
         print("}")
 
 
 class SearchEngine:
-    def __init__(self, strategy='depth_first', cc_level='default'):
-        self.set_strategy(strategy, cc_level)
+    def __init__(self, strategy='depth_first', cc_level='default', open_type='heap', closed_type='dict'):
+        self.set_strategy(strategy, cc_level, open_type, closed_type)
         self.trace = 0
+        # maximum number of states in the transposition table of the ida_star strategy
+        self.transposition_size = _TRANSPOSITION_SIZE
+        self.max_nodes = None
+        # maximum number of generated states between two reads of the clock, and
+        # the seconds a search keeps in reserve to return before its deadline
+        self.deadline_check_interval = _DEADLINE_CHECK_INTERVAL
+        self.deadline_slack = _DEADLINE_SLACK
+        # seconds per table entry a search keeps in reserve to free its tables
+        # and return in time, measured as the searches of this engine run
+        # (see _TEARDOWN_TIME)
+        self.teardown_time = _TEARDOWN_TIME
+        # whether this engine's search paused the garbage collector (see _pause_gc)
+        self.gc_paused = False
+        self.cancel_token = None
+        self.progress_fn = None
+        self.progress_interval = _PROGRESS_INTERVAL
+        self.telemetry = None
 
     def initStats(self):
-        sNode.n = 0
-        StateSpace.n = 1  # initial state already generated
+        # Counters are kept per engine (not in sNode.n / StateSpace.n) so that
+        # several engines can search in the same process or in threads.
+        self.nodes_created = 0
+        self.states_generated = 1  # initial state already generated
         self.cycle_check_pruned = 0
         self.cost_bound_pruned = 0
+        self.deadlock_pruned = 0
+        self.memory_dropped = 0
+        self.expansions = 0
+        self.incumbent = None
+
+    def new_node(self, state, hval, fval_function, hinfo=None):
+        '''Create a search node numbered by this engine'''
+        node = sNode(state, hval, fval_function, self.nodes_created, hinfo=hinfo)
+        self.nodes_created = self.nodes_created + 1
+        return node
+
+    def set_memory_bound(self, max_nodes, mode='sma', beam_width=None):
+        '''
+        Bound the number of nodes search keeps, i.e. the nodes on OPEN plus
+        the states remembered by full cycle checking, for the priority based
+        strategies (ucs, best_first, astar and custom).
+
+        Whenever an expansion takes the search over max_nodes, the worst
+        nodes on OPEN are dropped and the cycle checking table is rebuilt
+        with only the states on OPEN and their ancestors (states that were
+        forgotten may be expanded again later).
+
+        @param max_nodes: the node budget, or None for no bound.
+        @param mode: 'sma' keeps the best max_nodes // 4 nodes and, as in SMA*,
+                     backs up the lowest f-value of the dropped children of a
+                     state to their parent, which goes back on OPEN with that
+                     f-value so that the forgotten part of the search can be
+                     regenerated when it becomes the most promising again.
+                     'beam' cuts OPEN down to its beam_width best nodes
+                     whenever it grows past twice that, and forgets the others
+                     for good, which is faster but may miss solutions.
+        @param beam_width: the beam width, max_nodes // 2 by default.
+
+        Under a bound, a state reached again with the g-value it is remembered
+        with is pruned, so that backed-up states regenerate only what was
+        dropped. SMA* then still finds optimal solutions with an admissible
+        heuristic, quickly as long as the budget holds the nodes with the
+        lowest f-values. Below that SMA* keeps dropping and regenerating the
+        same states, as the whole of an f-value layer does not fit.
+        '''
+        if not mode in ['sma', 'beam']:
+            print('Unknown memory bound mode', mode)
+            print("Must be one of ['sma', 'beam']")
+            return
+        self.max_nodes = max_nodes
+        self.memory_mode = mode
+        self.beam_width = beam_width
+        if max_nodes is not None and beam_width is None:
+            self.beam_width = max(1, max_nodes // 2)
+
+    def set_cancel_token(self, token):
+        '''Stop the searches of this engine once token (a CancellationToken, or None) is cancelled'''
+        self.cancel_token = token
+
+    def set_progress(self, progress_fn, interval=_PROGRESS_INTERVAL):
+        '''
+        Call progress_fn with a SearchProgress every interval expansions
+        (give or take the expansions that generate no successors).
+
+        @param progress_fn: a function of a SearchProgress, or None for no reports.
+        @param interval: the number of expansions between two reports.
+        '''
+        self.progress_fn = progress_fn
+        self.progress_interval = interval
+
+    def set_telemetry(self, telemetry):
+        '''Record where the time of this engine's searches goes in telemetry (a SearchTelemetry, or None)'''
+        self.telemetry = telemetry
+
+    def _timing(self):
+        '''The function mapping a phase to the context manager timing it (see SearchTelemetry.timing)'''
+        if self.telemetry is not None:
+            return self.telemetry.timing
+        return _untimed
 
     def trace_on(self, level=1):
         '''For debugging, set tracking level 1 or 2'''
@@ -300,17 +998,35 @@ class SearchEngine:
         '''Turn off tracing'''
         self.trace = 0
 
-    def set_strategy(self, s, cc='default'):
-        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom']:
+    def set_strategy(self, s, cc='default', open_type='heap', closed_type='dict'):
+        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom', 'ida_star']:
             print('Unknown search strategy specified:', s)
-            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom' or 'astar'")
+            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom', 'astar' or 'ida_star'")
         elif not cc in ['default', 'none', 'path', 'full']:
             print('Unknown cycle check level', cc)
             print("Must be one of ['default', 'none', 'path', 'full']")
+        elif not open_type in ['heap', 'indexed', 'bucket']:
+            print('Unknown OPEN type', open_type)
+            print("Must be one of ['heap', 'indexed', 'bucket']")
+        elif not closed_type in ['dict', 'compact']:
+            print('Unknown closed table type', closed_type)
+            print("Must be one of ['dict', 'compact']")
 
         else:
+            if closed_type == 'dict':
+                self.closed_type = _CLOSED_DICT
+            elif closed_type == 'compact':
+                self.closed_type = _CLOSED_COMPACT
+
+            if open_type == 'heap':
+                self.open_type = _OPEN_HEAP
+            elif open_type == 'indexed':
+                self.open_type = _OPEN_INDEXED
+            elif open_type == 'bucket':
+                self.open_type = _OPEN_BUCKET
+
             if cc == 'default':
-                if s == 'depth_first':
+                if s == 'depth_first' or s == 'ida_star':
                     self.cycle_check = _CC_PATH
                 else:
                     self.cycle_check = _CC_FULL
@@ -333,6 +1049,8 @@ class SearchEngine:
                 self.strategy = _ASTAR
             elif s == 'custom':
                 self.strategy = _CUSTOM
+            elif s == 'ida_star':
+                self.strategy = _IDA_STAR
 
     def get_strategy(self):
         if self.strategy == _DEPTH_FIRST:
@@ -347,6 +1065,8 @@ class SearchEngine:
             rval = 'astar'
         elif self.strategy == _CUSTOM:
             rval = 'custom'
+        elif self.strategy == _IDA_STAR:
+            rval = 'ida_star'
 
         rval = rval + ' with '
 
@@ -357,9 +1077,24 @@ class SearchEngine:
         elif self.cycle_check == _CC_FULL:
             rval = rval + 'full cycle checking'
 
+        if self.strategy not in (_DEPTH_FIRST, _BREADTH_FIRST, _IDA_STAR):
+            if self.open_type == _OPEN_INDEXED:
+                rval = rval + ' (indexed OPEN)'
+            elif self.open_type == _OPEN_BUCKET:
+                rval = rval + ' (bucket OPEN)'
+
+        if self.cycle_check == _CC_FULL and self.closed_type == _CLOSED_COMPACT:
+            rval = rval + ' (compact closed table)'
+
         return rval
 
-    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function):
+    def new_closed_table(self):
+        '''An empty table from hashable_state to g-value, of the type set by set_strategy'''
+        if self.closed_type == _CLOSED_COMPACT:
+            return CompactClosedTable()
+        return dict()
+
+    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function, prune_fn=None):
         """
         Get ready to search. Call search on this object to run the search.
 
@@ -367,6 +1102,8 @@ class SearchEngine:
         @param goal_fn: the goal function for the puzzle
         @param heur_fn: the heuristic function to use (only relevant for search strategies that use heuristics)
         @param fval_fn: the f-value function (only relevant for custom search strategy)
+        @param prune_fn: optional dead-state test; successors for which it returns True (e.g. deadlocked
+                         states from which no goal can be reached) are discarded before they enter OPEN
         """
         # Perform full cycle checking as follows
         # a. check state before inserting into OPEN. If we had already reached
@@ -386,48 +1123,678 @@ class SearchEngine:
             print("   TRACE: Initial State:", end="")
             initState.print_state()
         # END
-        self.open = Open(self.strategy)
+        self.open = Open(self.strategy, self.open_type)
 
-        node = sNode(initState, heur_fn(initState), fval_function)
+        if isinstance(heur_fn, IncrementalHeuristic):
+            hval, hinfo = heur_fn.initial(initState)
+            node = self.new_node(initState, hval, fval_function, hinfo)
+        else:
+            node = self.new_node(initState, heur_fn(initState), fval_function)
 
         # the cycle check dictionary stores the cheapest path (g-val) found
-        # so far to a state.
-        if self.cycle_check == _CC_FULL:
-            self.cc_dictionary = dict()
+        # so far to a state. (IDA* keeps its own transposition table instead.)
+        if self.cycle_check == _CC_FULL and self.strategy != _IDA_STAR:
+            self.cc_dictionary = self.new_closed_table()
             self.cc_dictionary[initState.hashable_state()] = initState.gval
+        # states dropped by the memory bound, see _rebuild_closed
+        self.forgotten = set()
+        # where IDA* returned, so that search can resume it (see _searchIDA)
+        self.ida_iteration = None
 
         self.open.insert(node)
         self.fval_function = fval_function
         self.goal_fn = goal_fn
         self.heur_fn = heur_fn
+        self.prune_fn = prune_fn
 
-    def search(self, timebound=None, costbound=None):
+    @_timed_search
+    def search(self, timebound=None, costbound=None, deadline=None):
         """
         Start searching, using the parameters set by init_search.
 
         @param timebound: the maximum amount of time, in seconds, to spend on this search.
         @param costbound: the cost bound 3-tuple for pruning, as specified in the assignment.
+        @param deadline: an optional time.monotonic() time by which the search must have
+                         returned (see search_deadline); the earlier of it and timebound applies.
 
         This code will return a goal path (if one is found) as well as a SearchStat object containing
         statistics about the given search (assuming a solution is found).
         """
 
         ###NOW do the search and return the result
-        self.search_start_time = os.times()[0]
-        self.search_stop_time = None
-        if timebound:
-            self.search_stop_time = self.search_start_time + timebound
+        self.start_clock(timebound, deadline)
 
-        goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+        if self.strategy == _IDA_STAR:
+            goal_node = self._searchIDA(self.goal_fn, self.heur_fn, costbound)
+        else:
+            goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
 
-        total_search_time = os.times()[0] - self.search_start_time
-        stats = SearchStats(sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned, total_search_time)
+        if goal_node and self.telemetry is not None:
+            self.telemetry.solution(goal_node.gval)
+        stats = self.end_search()
 
         if goal_node:
             return goal_node.state, stats
         else:  # exited the while without finding goal---search failed
             return False, stats
 
+    def start_clock(self, timebound=None, deadline=None):
+        '''
+        Start timing a search that must return by the earlier of deadline and
+        timebound seconds from now. SearchStats report the CPU time it takes.
+        A search with a deadline pauses the garbage collector (see _pause_gc),
+        so the searches that call this are decorated with _timed_search.
+        '''
+        self.search_start_time = os.times()[0]
+        self.search_stop_time = None
+        deadline = search_deadline(timebound, deadline)
+        if deadline is not None:
+            self.search_stop_time = deadline - self.deadline_slack
+            if not self.gc_paused:
+                self.gc_paused = True
+                _pause_gc()
+        # call should_stop once the number of generated states reaches next_check
+        self.next_check = math.inf
+        if deadline is not None or self.cancel_token is not None or self.progress_fn is not None:
+            self.next_check = self.states_generated
+        self.last_check = (time.monotonic(), self.states_generated)
+        self.last_progress = (self.last_check[0], self.expansions)
+        self.next_progress = self.expansions + self.progress_interval
+        if self.telemetry is not None:
+            self.telemetry.start(self.get_strategy())
+
+    def end_search(self):
+        '''The SearchStats of the search that is returning (see start_clock); also ends its telemetry'''
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        return self.get_stats(os.times()[0] - self.search_start_time)
+
+    def should_stop(self, best_f, open_size, closed_size, reserve=0):
+        '''
+        Called by the searches once self.next_check states have been
+        generated. Reports progress if it is due, and returns True if the
+        search must stop now: because it was cancelled, or to meet its
+        deadline while keeping reserve more seconds for its teardown.
+        Otherwise decides when to check next: before half of the time left
+        (and of the slack) can be used up at the rate states were generated
+        since the last check, and no later than the next progress report.
+        '''
+        now = time.monotonic()
+        if self.progress_fn is not None and self.expansions >= self.next_progress:
+            last_time, last_expansions = self.last_progress
+            rate = (self.expansions - last_expansions) / max(now - last_time, 1e-6)
+            self.progress_fn(SearchProgress(self.expansions, self.states_generated, best_f, open_size, closed_size,
+                                            rate, self.incumbent, os.times()[0] - self.search_start_time))
+            self.last_progress = (now, self.expansions)
+            self.next_progress = self.expansions + self.progress_interval
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            print("TRACE: Search was cancelled.")
+            return True
+
+        interval = self.deadline_check_interval
+        if self.search_stop_time is not None:
+            stop_time = self.search_stop_time - reserve
+            if now >= stop_time:
+                print("TRACE: Search has exceeeded the time bound provided.")
+                return True
+            last_time, last_generated = self.last_check
+            rate = (self.states_generated - last_generated) / max(now - last_time, 1e-6)
+            interval = min(interval, int(rate * min(stop_time - now, self.deadline_slack) / 2))
+        if self.progress_fn is not None:
+            interval = min(interval, self.next_progress - self.expansions)
+        self.next_check = self.states_generated + max(1, interval)
+        self.last_check = (now, self.states_generated)
+        return False
+
+    def get_stats(self, total_search_time):
+        '''The SearchStats of this engine's searches so far'''
+        return SearchStats(self.nodes_created, self.states_generated, self.cycle_check_pruned,
+                           self.cost_bound_pruned, total_search_time, self.deadlock_pruned, self.memory_dropped)
+
+    @_timed_search
+    def anytime_search(self, weight, timebound=None, weight_decay=0.5, costbound=None, deadline=None):
+        """
+        Anytime weighted A* in the style of ARA*, using the parameters set by init_search
+        (the fval_function given there is not used, nodes are ordered by g + weight * h).
+
+        The search runs a sequence of weighted A* iterations. Each time a
+        better solution is found the weight is multiplied by weight_decay
+        (down to 1), and the search carries on from where it stopped instead
+        of starting over: the nodes on OPEN, together with the nodes that
+        were reached by a cheaper path after being expanded (INCONS), are
+        re-prioritized under the new weight, and every node that can no
+        longer lead to a cheaper solution (g + h >= cost of the best
+        solution) is dropped. The search ends when the timebound runs out,
+        when OPEN is empty, or when an iteration with weight 1 completes.
+
+        @param weight: the initial weight, or None for greedy best-first
+                       iterations that order nodes by h only.
+        @param timebound: the maximum amount of time, in seconds, to spend.
+        @param weight_decay: the factor applied to the weight after each solution.
+        @param costbound: an optional cost bound 3-tuple, as for search.
+        @param deadline: an optional deadline, as for search.
+
+        Returns the best goal state found (or False) and a SearchStats object.
+        """
+        self.start_clock(timebound, deadline)
+
+        goal_fn = self.goal_fn
+        heur_fn = self.heur_fn
+        incremental = isinstance(heur_fn, IncrementalHeuristic)
+        if weight is None:
+            key = lambda node: (node.hval, node.index, node)
+        else:
+            key = lambda node: (node.gval + weight * node.hval, -node.gval, node.index, node)
+
+        # best_g: the cheapest g-value found so far for each state
+        # on_open: state -> its current node on OPEN (heap entries for other nodes are stale)
+        # closed: states expanded during the current iteration
+        # incons: states reached by a cheaper path after being expanded in the current iteration
+        best_g = self.new_closed_table()
+        on_open = dict()
+        for node in self.open.nodes():
+            hash_state = node.state.hashable_state()
+            if hash_state not in on_open or node.gval < on_open[hash_state].gval:
+                on_open[hash_state] = node
+                best_g[hash_state] = node.gval
+        closed = set()
+        incons = dict()
+        heap = [key(node) for node in on_open.values()]
+        heapq.heapify(heap)
+        self.incumbent = None
+        telemetry = self.telemetry
+        timing = self._timing()
+
+        while True:
+            timed_out = False
+            while heap:
+                entry = heap[0]
+                # with h(goal) = 0 the key of the best solution is its cost, so once no node
+                # on OPEN has a lower key the current weight can not improve the solution
+                if weight is not None and self.incumbent is not None and entry[0] >= self.incumbent.gval:
+                    break
+                with timing('open'):
+                    heapq.heappop(heap)
+                node = entry[-1]
+                hash_state = node.state.hashable_state()
+                if on_open.get(hash_state) is not node:
+                    continue
+                del on_open[hash_state]
+
+                if goal_fn(node.state):
+                    self.incumbent = node.state
+                    if telemetry is not None:
+                        telemetry.solution(node.gval)
+                    if self.trace:
+                        print("   TRACE: Anytime search found solution of cost {} with weight {}".format(
+                            node.gval, weight))
+                    break
+                if self.states_generated >= self.next_check and \
+                        self.should_stop(node.gval + node.hval, len(on_open), len(best_g),
+                                         (len(best_g) + len(heap)) * self.teardown_time):
+                    timed_out = True
+                    break
+
+                closed.add(hash_state)
+                if telemetry is not None:
+                    telemetry.expanded(node.gval, node.hval, len(on_open), len(best_g))
+                with timing('successors'):
+                    successors = node.state.successors()
+                self.expansions = self.expansions + 1
+                self.states_generated = self.states_generated + len(successors)
+                for succ in successors:
+                    with timing('cycle_check'):
+                        succ_hash = succ.hashable_state()
+                        prune_succ = succ_hash in best_g and succ.gval >= best_g[succ_hash]
+                    if prune_succ:
+                        self.cycle_check_pruned = self.cycle_check_pruned + 1
+                        continue
+                    filtered = self._filter_successor(succ, node, heur_fn, incremental, costbound, timing)
+                    if filtered is None:
+                        continue
+                    succ_hval, succ_hinfo = filtered
+                    if self.incumbent is not None and (succ.gval >= self.incumbent.gval or
+                                                       (weight is not None and
+                                                        succ.gval + succ_hval >= self.incumbent.gval)):
+                        self.cost_bound_pruned = self.cost_bound_pruned + 1
+                        continue
+
+                    best_g[succ_hash] = succ.gval
+                    succ_node = self.new_node(succ, succ_hval, node.fval_function, succ_hinfo)
+                    if succ_hash in closed:
+                        incons[succ_hash] = succ_node
+                    else:
+                        on_open[succ_hash] = succ_node
+                        with timing('open'):
+                            heapq.heappush(heap, key(succ_node))
+
+            if timed_out:
+                break
+            if self.search_stop_time is not None and \
+                    time.monotonic() > self.search_stop_time - 2 * (len(best_g) + len(heap)) * self.teardown_time:
+                print("TRACE: Search has exceeeded the time bound provided.")
+                break
+            if self.incumbent is None and not heap:
+                break
+            if weight is not None and weight <= 1 and (not heap or heap[0][0] >= self.incumbent.gval):
+                # an iteration with weight 1 completed: no better solution exists (for admissible h)
+                break
+
+            # next iteration: lower the weight and re-prioritize OPEN and INCONS
+            if weight is not None:
+                weight = max(1, weight * weight_decay)
+            on_open.update(incons)
+            incons = dict()
+            closed = set()
+            for hash_state, node in list(on_open.items()):
+                if self.incumbent is not None and (
+                        node.gval >= self.incumbent.gval or
+                        (weight is not None and node.gval + node.hval >= self.incumbent.gval)):
+                    del on_open[hash_state]
+            if not on_open:
+                break
+            with timing('open'):
+                heap = [key(node) for node in on_open.values()]
+                heapq.heapify(heap)
+
+        # free the tables here rather than on return, timing it for teardown_time
+        teardown_entries = len(best_g) + len(heap)
+        started = time.perf_counter()
+        heap = on_open = incons = closed = best_g = None
+        self._learn_teardown(teardown_entries, started)
+
+        stats = self.end_search()
+        if self.incumbent is not None:
+            return self.incumbent, stats
+        return False, stats
+
+    @_timed_search
+    def bidirectional_search(self, backward_states, meet_key, join_fn, timebound=None, deadline=None):
+        """
+        Bidirectional breadth-first search, using the initial state, goal_fn and prune_fn set by init_search
+        (the heuristic is not used).
+
+        A forward frontier grows from the initial state and a backward frontier grows from
+        backward_states, which are the states of a reverse search space (e.g. goal configurations whose
+        successors undo moves). Each step expands a whole layer of the smaller frontier. The two searches
+        meet when a forward and a backward state have the same meet_key; join_fn(forward_state,
+        backward_state) then turns the pair into a goal state of the forward space, or returns None if
+        the pair can not be joined after all and the search carries on.
+
+        @param backward_states: the start states of the reverse search.
+        @param meet_key: a function mapping states of either direction to a hashable key.
+        @param join_fn: the function joining a forward and a backward state with the same key.
+        @param timebound: the maximum amount of time, in seconds, to spend.
+        @param deadline: an optional deadline, as for search.
+
+        Returns a goal state (or False) and a SearchStats object.
+        """
+        self.start_clock(timebound, deadline)
+
+        # visited: hashable_state -> state, for cycle checking in each direction
+        # meet: meet_key -> states with that key, in each direction
+        forward = [node.state for node in self.open.nodes()]
+        forward_visited = {state.hashable_state(): state for state in forward}
+        forward_meet = dict()
+        backward = list(backward_states)
+        backward_visited = {state.hashable_state(): state for state in backward}
+        backward_meet = dict()
+        self.states_generated = self.states_generated + len(backward)
+
+        def meet(state, own_meet, other_meet, is_forward):
+            key = meet_key(state)
+            own_meet.setdefault(key, []).append(state)
+            for other in other_meet.get(key, ()):
+                # a join costs at least a generation, so count it towards the next clock check
+                self.states_generated = self.states_generated + 1
+                goal = join_fn(state, other) if is_forward else join_fn(other, state)
+                if goal:
+                    return goal
+            return None
+
+        def out_of_time():
+            # the reserve leaves time to free the visited and meet tables before returning
+            if self.states_generated < self.next_check:
+                return False
+            visited_size = len(forward_visited) + len(backward_visited)
+            reserve = (visited_size + len(forward_meet) + len(backward_meet)) * self.teardown_time
+            return self.should_stop(None, len(forward) + len(backward), visited_size, reserve)
+
+        telemetry = self.telemetry
+        timing = self._timing()
+        goal = None
+        timed_out = False
+        for state in forward:
+            if self.goal_fn(state):
+                goal = state
+                break
+            meet(state, forward_meet, backward_meet, True)
+        if goal is None:
+            for state in backward:
+                goal = meet(state, backward_meet, forward_meet, False)
+                if goal:
+                    break
+
+        while forward and backward and goal is None:
+            is_forward = len(forward) <= len(backward)
+            if is_forward:
+                frontier, visited, own_meet, other_meet = forward, forward_visited, forward_meet, backward_meet
+            else:
+                frontier, visited, own_meet, other_meet = backward, backward_visited, backward_meet, forward_meet
+            # BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Expanding {} {} states".format(len(frontier), "forward" if is_forward else "backward"))
+            # END
+
+            layer = []
+            for state in frontier:
+                if out_of_time():
+                    timed_out = True
+                    break
+                self.nodes_created = self.nodes_created + 1
+                self.expansions = self.expansions + 1
+                if telemetry is not None:
+                    telemetry.expanded(state.gval, 0, len(forward) + len(backward),
+                                       len(forward_visited) + len(backward_visited))
+                with timing('successors'):
+                    successors = state.successors()
+                self.states_generated = self.states_generated + len(successors)
+                for succ in successors:
+                    with timing('cycle_check'):
+                        hash_state = succ.hashable_state()
+                        seen = hash_state in visited
+                    if seen:
+                        self.cycle_check_pruned = self.cycle_check_pruned + 1
+                        continue
+                    visited[hash_state] = succ
+                    if is_forward and self.prune_fn is not None and self.prune_fn(succ):
+                        self.deadlock_pruned = self.deadlock_pruned + 1
+                        continue
+                    if is_forward and self.goal_fn(succ):
+                        goal = succ
+                        break
+                    layer.append(succ)
+                    goal = meet(succ, own_meet, other_meet, is_forward)
+                    if goal:
+                        break
+                    if out_of_time():
+                        timed_out = True
+                        break
+                if goal or timed_out:
+                    break
+            if timed_out:
+                break
+
+            if is_forward:
+                forward = layer
+            else:
+                backward = layer
+
+        if goal and telemetry is not None:
+            telemetry.solution(goal.gval)
+        # free the tables here rather than on return, timing it for teardown_time
+        teardown_entries = len(forward_visited) + len(backward_visited) + len(forward_meet) + len(backward_meet)
+        started = time.perf_counter()
+        forward = backward = frontier = layer = visited = own_meet = other_meet = None
+        forward_visited = backward_visited = forward_meet = backward_meet = None
+        self._learn_teardown(teardown_entries, started)
+        stats = self.end_search()
+        if goal:
+            return goal, stats
+        return False, stats
+
+    def _filter_successor(self, succ, node, heur_fn, incremental, costbound, timing):
+        '''
+        The tests every search makes of a successor of node once it has passed cycle checking: the prune_fn,
+        then the cost bound on its g, h and f-values. Pruned successors are counted in the SearchStats.
+        @return: The hval and hinfo (see IncrementalHeuristic) of succ, or None if it is pruned.
+        '''
+        if self.prune_fn is not None and self.prune_fn(succ):
+            self.deadlock_pruned = self.deadlock_pruned + 1
+            # BEGIN TRACING
+            if self.trace > 1:
+                print(" TRACE: Successor State pruned by deadlock checking")
+                print("\n")
+            # END TRACING
+            return None
+        with timing('heuristic'):
+            if incremental:
+                succ_hval, succ_hinfo = heur_fn.update(succ, node.state, node.hinfo)
+            else:
+                succ_hval, succ_hinfo = heur_fn(succ), None
+        if costbound is not None and (succ.gval > costbound[0] or
+                                      succ_hval > costbound[1] or
+                                      succ.gval + succ_hval > costbound[2]):
+            self.cost_bound_pruned = self.cost_bound_pruned + 1
+            # BEGIN TRACING
+            if self.trace > 1:
+                print(" TRACE: Successor State pruned, over current cost bound of {}", costbound)
+                print("\n")
+            # END TRACING
+            return None
+        return succ_hval, succ_hinfo
+
+    def _learn_teardown(self, entries, started):
+        '''Update teardown_time from a search that started freeing its tables (with entries entries) at started'''
+        if entries >= _TEARDOWN_SAMPLE:
+            estimate = _TEARDOWN_MARGIN * (time.perf_counter() - started) / entries
+            self.teardown_time = max(estimate, _TEARDOWN_DECAY * self.teardown_time)
+
+    def _bound_memory(self, heur_fn):
+        '''Drop nodes from OPEN and the cycle checking table as set by set_memory_bound'''
+        closed_size = len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0
+        if self.memory_mode == 'beam':
+            if len(self.open) <= 2 * self.beam_width and len(self.open) + closed_size <= self.max_nodes:
+                return
+            keep = self.beam_width
+        else:
+            if len(self.open) + closed_size <= self.max_nodes:
+                return
+            keep = max(1, self.max_nodes // 4)
+
+        # shrink to at most 3/4 of the budget, so that the search can run a
+        # while before the next bound (fewer nodes are kept if the ancestors
+        # of the best nodes take up too much room)
+        while True:
+            dropped = self.open.prune(keep)
+            self.memory_dropped = self.memory_dropped + len(dropped)
+            # BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Memory bound dropped {} nodes from OPEN".format(len(dropped)))
+            # END TRACING
+            if self.memory_mode == 'sma':
+                self._back_up(dropped, heur_fn)
+            # SMA* must also forget the dropped states, for their backed-up parents to generate them again
+            if self.cycle_check == _CC_FULL and (self.memory_mode == 'sma' or
+                                                 len(self.open) + len(self.cc_dictionary) > self.max_nodes):
+                self._rebuild_closed()
+            closed_size = len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0
+            if keep == 1 or len(self.open) + closed_size <= 3 * self.max_nodes // 4:
+                break
+            keep = max(1, keep // 2)
+
+    def _back_up(self, dropped, heur_fn):
+        '''
+        SMA* backup: put the parents of dropped nodes back on OPEN, with the
+        lowest f-value of their dropped children (the h-value of a parent is
+        only computed again for an incremental heuristic, whose children
+        need its hinfo).
+        '''
+        # hashable_state -> (its cheapest state, the lowest estimate of the
+        # cost from there to a goal through the forgotten states)
+        backed_up = dict()
+
+        def back_up(state, to_goal):
+            state_hash = state.hashable_state()
+            if state_hash in backed_up:
+                cheapest, cheapest_to_goal = backed_up[state_hash]
+                if cheapest.gval <= state.gval:
+                    state = cheapest
+                to_goal = min(to_goal, cheapest_to_goal)
+            backed_up[state_hash] = (state, to_goal)
+
+        for node in dropped:
+            self.forgotten.add(node.state.hashable_state())
+            parent = node.state.parent
+            if parent is None:
+                # the start state is never forgotten
+                back_up(node.state, node.hval)
+            else:
+                back_up(parent, node.gval - parent.gval + node.hval)
+        # a dropped (backed-up) node whose state goes back on OPEN keeps standing for its own forgotten children
+        for node in dropped:
+            state_hash = node.state.hashable_state()
+            if state_hash in backed_up and backed_up[state_hash][0].gval >= node.gval:
+                back_up(node.state, node.hval)
+        # hashable_state -> its node on OPEN with the lowest g (and f) value
+        on_open = dict()
+        for node in self.open.nodes():
+            state_hash = node.state.hashable_state()
+            other = on_open.get(state_hash)
+            if other is None or (node.gval, node.hval) < (other.gval, other.hval):
+                on_open[state_hash] = node
+        incremental = isinstance(heur_fn, IncrementalHeuristic)
+        for parent_hash, (parent, to_goal) in backed_up.items():
+            other = on_open.get(parent_hash)
+            if other is not None and other.gval <= parent.gval:
+                # the cheaper node on OPEN stands for the parent, with the lower f-value of the two
+                if other.gval + other.hval <= parent.gval + to_goal:
+                    continue
+                to_goal = parent.gval + to_goal - other.gval
+                parent = other.state
+            hinfo = heur_fn.initial(parent)[1] if incremental else None
+            self.open.insert(self.new_node(parent, to_goal, self.fval_function, hinfo))
+            self.forgotten.discard(parent_hash)
+
+    def _rebuild_closed(self):
+        '''
+        Forget the cycle checking entries of all states but those on OPEN and
+        their ancestors. Under SMA* the ancestors that were forgotten (dropped
+        from OPEN) are left out too, so that they are expanded again when their
+        backed-up parents generate them, and self.forgotten is cut down to them.
+        '''
+        cc_dictionary = self.new_closed_table()
+        forgotten = self.forgotten
+        still_forgotten = set()
+        for node in self.open.nodes():
+            state = node.state
+            state_hash = state.hashable_state()
+            if cc_dictionary.get(state_hash, math.inf) > state.gval:
+                cc_dictionary[state_hash] = state.gval
+            state = state.parent
+            while state is not None:
+                state_hash = state.hashable_state()
+                if state_hash in forgotten:
+                    still_forgotten.add(state_hash)
+                elif cc_dictionary.get(state_hash, math.inf) > state.gval:
+                    cc_dictionary[state_hash] = state.gval
+                else:
+                    break
+                state = state.parent
+        self.cc_dictionary = cc_dictionary
+        self.forgotten = still_forgotten
+
+    def _searchIDA(self, goal_fn, heur_fn, costbound):
+        """
+        Iterative deepening A*, starting from the node on self.open.
+
+        Each iteration is a depth-first search, run with an explicit stack,
+        that only expands nodes with f = g + h up to a threshold; the next
+        iteration uses the smallest f-value that went over it. Besides the
+        states on the current path (which are never revisited) a
+        transposition table remembers the g-value with which each state
+        was first reached in the iteration, and a state reached again with
+        no smaller g-value is pruned. The table holds at most
+        self.transposition_size states, so memory is bounded however long
+        the search runs; once it is full the search only re-expands more.
+        IDA* always prunes with the path and this table, whatever cycle
+        checking was set: there is no full cycle checking dictionary.
+        The iteration is kept in self.ida_iteration when the search
+        returns, and calling search again resumes it from there.
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        """
+        if self.ida_iteration is None:
+            root = self.open.extract()
+            threshold = root.gval + root.hval
+            next_threshold = table = on_path = stack = None
+        else:
+            # resumed: carry on with the iteration where the last call returned
+            root, threshold, next_threshold, table, on_path, stack = self.ida_iteration
+        incremental = isinstance(heur_fn, IncrementalHeuristic)
+        telemetry = self.telemetry
+        timing = self._timing()
+
+        while threshold != math.inf:
+            if stack is None:
+                # BEGIN TRACING
+                if self.trace:
+                    print("   TRACE: IDA* iteration with f-value threshold", threshold)
+                # END TRACING
+                next_threshold = math.inf
+                table = {root.state.hashable_state(): root.gval}
+                on_path = {root.state.hashable_state()}
+                # stack entries are [node, iterator over its successors (None until it is expanded)]
+                stack = [[root, None]]
+
+            while stack:
+                entry = stack[-1]
+                node = entry[0]
+                if entry[1] is None:
+                    f_value = node.gval + node.hval
+                    if f_value > threshold:
+                        next_threshold = min(next_threshold, f_value)
+                        stack.pop()
+                        on_path.discard(node.state.hashable_state())
+                        continue
+                    if goal_fn(node.state):
+                        # a resumed search goes on past this goal
+                        entry[1] = iter(())
+                        self.ida_iteration = (root, threshold, next_threshold, table, on_path, stack)
+                        return node
+                    if self.states_generated >= self.next_check and \
+                            self.should_stop(f_value, len(stack), len(table),
+                                             (len(stack) + len(table)) * self.teardown_time):
+                        self.ida_iteration = (root, threshold, next_threshold, table, on_path, stack)
+                        return False
+                    if telemetry is not None:
+                        telemetry.expanded(node.gval, node.hval, len(stack), len(table))
+                    with timing('successors'):
+                        successors = node.state.successors()
+                    self.expansions = self.expansions + 1
+                    self.states_generated = self.states_generated + len(successors)
+                    entry[1] = iter(successors)
+
+                succ = next(entry[1], None)
+                if succ is None:
+                    stack.pop()
+                    on_path.discard(node.state.hashable_state())
+                    continue
+
+                with timing('cycle_check'):
+                    hash_state = succ.hashable_state()
+                    prune_succ = hash_state in on_path or table.get(hash_state, math.inf) <= succ.gval
+                if prune_succ:
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
+                filtered = self._filter_successor(succ, node, heur_fn, incremental, costbound, timing)
+                if filtered is None:
+                    continue
+                succ_hval, succ_hinfo = filtered
+
+                if hash_state in table or len(table) < self.transposition_size:
+                    table[hash_state] = succ.gval
+                on_path.add(hash_state)
+                stack.append([self.new_node(succ, succ_hval, node.fval_function, succ_hinfo), None])
+
+            threshold = next_threshold
+            stack = None
+
+        self.ida_iteration = (root, threshold, None, None, None, None)
+        return False
+
     def _searchOpen(self, goal_fn, heur_fn, fval_function, costbound):
         """
         Search, starting from self.open.
@@ -443,8 +1810,15 @@ class SearchEngine:
             if self.cycle_check == _CC_FULL:
                 print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
         # END TRACING
+        incremental = isinstance(heur_fn, IncrementalHeuristic)
+        # under a memory bound a backed-up state is expanded again, and its children that
+        # are still remembered with the same g-value must not be searched again
+        prune_equal = self.max_nodes is not None and self.open.key is not None
+        telemetry = self.telemetry
+        timing = self._timing()
         while not self.open.empty():
-            node = self.open.extract()
+            with timing('open'):
+                node = self.open.extract()
 
             # BEGIN TRACING
             if self.trace:
@@ -457,10 +1831,12 @@ class SearchEngine:
             if goal_fn(node.state):
                 # node at front of OPEN is a goal...search is completed.
                 return node
-            if self.search_stop_time:  # timebound check
-                if os.times()[0] > self.search_stop_time:
-                    # exceeded time bound, must terminate search
-                    print("TRACE: Search has exceeeded the time bound provided.")
+            if self.states_generated >= self.next_check:  # timebound, cancellation and progress check
+                # keep time in reserve for the caller to free OPEN and the cycle checking table
+                closed_size = len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0
+                if self.should_stop(node.gval + node.hval, len(self.open), closed_size,
+                                    (len(self.open) + closed_size) * self.teardown_time):
+                    # exceeded time bound or cancelled, must terminate search
                     return False
 
             # All states reached by a search node on OPEN have already
@@ -479,7 +1855,13 @@ class SearchEngine:
             if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
                 continue
 
-            successors = node.state.successors()
+            if telemetry is not None:
+                telemetry.expanded(node.gval, node.hval, len(self.open),
+                                   len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0)
+            with timing('successors'):
+                successors = node.state.successors()
+            self.expansions = self.expansions + 1
+            self.states_generated = self.states_generated + len(successors)
 
             # BEGIN TRACING
             if self.trace:
@@ -491,7 +1873,17 @@ class SearchEngine:
             # END TRACING
 
             for succ in successors:
-                hash_state = succ.hashable_state()
+                with timing('cycle_check'):
+                    hash_state = succ.hashable_state()
+                    prune_succ = (self.cycle_check == _CC_FULL and
+                                  hash_state in self.cc_dictionary and
+                                  (succ.gval > self.cc_dictionary[hash_state] or
+                                   prune_equal and succ.gval == self.cc_dictionary[hash_state])
+                                  ) or (
+                                         self.cycle_check == _CC_PATH and
+                                         succ.has_path_cycle()
+                                 )
+
                 if self.trace > 1:
                     if self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary:
                         print("   TRACE: Already in CC_dict, CC_dict gval={}, successor state gval={}".format(
@@ -511,14 +1903,6 @@ class SearchEngine:
                         print("   TRACE: On cyclic path")
                 # END TRACING
 
-                prune_succ = (self.cycle_check == _CC_FULL and
-                              hash_state in self.cc_dictionary and
-                              succ.gval > self.cc_dictionary[hash_state]
-                              ) or (
-                                     self.cycle_check == _CC_PATH and
-                                     succ.has_path_cycle()
-                             )
-
                 if prune_succ:
                     self.cycle_check_pruned = self.cycle_check_pruned + 1
                     # BEGIN TRACING
@@ -528,18 +1912,15 @@ class SearchEngine:
                         # END TRACING
                     continue
 
-                succ_hval = heur_fn(succ)
-                if costbound is not None and (succ.gval > costbound[0] or
-                                              succ_hval > costbound[1] or
-                                              succ.gval + succ_hval > costbound[2]):
-                    self.cost_bound_pruned = self.cost_bound_pruned + 1
-                    if self.trace > 1:
-                        print(" TRACE: Successor State pruned, over current cost bound of {}", costbound)
-                        print("\n")
+                filtered = self._filter_successor(succ, node, heur_fn, incremental, costbound, timing)
+                if filtered is None:
                     continue
+                succ_hval, succ_hinfo = filtered
 
                     # passed all cycle checks and costbound checks ...add to open
-                self.open.insert(sNode(succ, succ_hval, node.fval_function))
+                succ_node = self.new_node(succ, succ_hval, node.fval_function, succ_hinfo)
+                with timing('open'):
+                    self.open.insert(succ_node)
 
                 # BEGIN TRACING
                 if self.trace > 1:
@@ -550,6 +1931,12 @@ class SearchEngine:
                 # record cost of this path in dictionary.
                 if self.cycle_check == _CC_FULL:
                     self.cc_dictionary[hash_state] = succ.gval
+                    if self.forgotten:
+                        self.forgotten.discard(hash_state)
+
+            if self.max_nodes is not None and self.open.key is not None:
+                with timing('open'):
+                    self._bound_memory(heur_fn)
 
         # end of while--OPEN is empty and no solution
         return False
@@ -6,12 +6,93 @@
     Code also contains a list of 20 Sokoban problems for the purpose of testing.
 '''
 
+import math
+import random
+import itertools
+from array import array
 from search import *
 
 
-class SokobanState(StateSpace):
+class BaseSokobanState(StateSpace):
+    '''
+    What every Sokoban state representation shares: width, height, storage and obstacles, read through the
+    SokobanLevel in the level data item, and printing, from the robots and boxes each subclass provides as
+    locations. It has no data items of its own, so each subclass declares all of its slots (e.g.
+    BitboardSokobanState keeps bitmasks, not the robots and boxes of SokobanState).
+    '''
+    __slots__ = ()
+
+    @property
+    def width(self):
+        return self.level.width
+
+    @property
+    def height(self):
+        return self.level.height
+
+    @property
+    def storage(self):
+        return self.level.storage
+
+    @property
+    def obstacles(self):
+        return self.level.obstacles
+
+    def state_string(self):
+        '''Returns a string representation fo a state that can be printed to stdout.'''
+        map = []
+        for y in range(0, self.height):
+            row = []
+            for x in range(0, self.width):
+                row += [' ']
+            map += [row]
+
+        for storage_point in self.storage:
+            map[storage_point[1]][storage_point[0]] = '.'
+        for obstacle in self.obstacles:
+            map[obstacle[1]][obstacle[0]] = '#'
+        for i, robot in enumerate(self.robots):
+            if robot in self.storage:
+                map[robot[1]][robot[0]] = chr(ord('A') + i)
+            else:
+                map[robot[1]][robot[0]] = chr(ord('a') + i)
+        for box in self.boxes:
+            if box in self.storage:
+                map[box[1]][box[0]] = '*'
+            else:
+                map[box[1]][box[0]] = '$'
+
+        for y in range(0, self.height):
+            map[y] = ['#'] + map[y]
+            map[y] = map[y] + ['#']
+        map = ['#' * (self.width + 2)] + map
+        map = map + ['#' * (self.width + 2)]
+
+        s = ''
+        for row in map:
+            for char in row:
+                s += char
+            s += '\n'
+
+        return s
 
-    def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles):
+    def print_state(self):
+        '''
+        Prints the string representation of the state. ASCII art FTW!
+        '''
+        print("ACTION was " + self.action)
+        print(self.state_string())
+
+
+class SokobanState(BaseSokobanState):
+    '''
+    A Sokoban state: the robots and boxes. The static part of the problem (width, height, storage and
+    obstacles) is held once in a SokobanLevel shared by all the states of the problem, and read through it.
+    '''
+    __slots__ = ('level', 'robots', 'boxes', 'symmetric_robots')
+
+    def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles, symmetric_robots=None,
+                 level=None):
         '''
         Creates a new Sokoban state.
         @param width: The room's X dimension (excluding walls).
@@ -20,14 +101,19 @@ class SokobanState(StateSpace):
         @param boxes: A frozenset of all the boxes.
         @param storage: A frozenset of all the storage points.
         @param obstacles: A frozenset of all the impassable obstacles.
+        @param symmetric_robots: Whether the robots are interchangeable for cycle checking, see hashable_state.
+                                 None (the default) inherits the setting of the parent (False for a start state).
+        @param level: The SokobanLevel of width, height, storage and obstacles, looked up if None.
         '''
         StateSpace.__init__(self, action, gval, parent)
-        self.width = width
-        self.height = height
+        if level is None:
+            level = SokobanLevel.get(width, height, storage, obstacles)
+        self.level = level
         self.robots = robots
         self.boxes = boxes
-        self.storage = storage
-        self.obstacles = obstacles
+        if symmetric_robots is None:
+            symmetric_robots = getattr(parent, 'symmetric_robots', False)
+        self.symmetric_robots = symmetric_robots
 
     def successors(self):
         '''
@@ -36,6 +122,9 @@ class SokobanState(StateSpace):
         successors = []
         transition_cost = 1
         moved_boxes = frozenset()
+        width = self.width
+        height = self.height
+        obstacles = self.obstacles
 
         for robot in range(0, len(self.robots)):
             for direction in (UP, RIGHT, DOWN, LEFT):
@@ -43,14 +132,14 @@ class SokobanState(StateSpace):
                 new_robots = list(self.robots);
                 new_robots.remove(self.robots[robot])
                 new_robots = tuple(new_robots)
-                new_boxes = set(self.boxes)
-                new_moved_boxes = set(moved_boxes)
+                # robot-only moves share the parent's boxes, so heuristics can tell them apart by identity
+                new_boxes = self.boxes
 
-                if new_location[0] < 0 or new_location[0] >= self.width:
+                if new_location[0] < 0 or new_location[0] >= width:
                     continue
-                if new_location[1] < 0 or new_location[1] >= self.height:
+                if new_location[1] < 0 or new_location[1] >= height:
                     continue
-                if new_location in self.obstacles:
+                if new_location in obstacles:
                     continue
                 if new_location in new_robots:
                     continue
@@ -60,85 +149,850 @@ class SokobanState(StateSpace):
                 if new_location in self.boxes:
                     new_box_location = direction.move(new_location)
 
-                    if new_box_location[0] < 0 or new_box_location[0] >= self.width:
+                    if new_box_location[0] < 0 or new_box_location[0] >= width:
                         continue
-                    if new_box_location[1] < 0 or new_box_location[1] >= self.height:
+                    if new_box_location[1] < 0 or new_box_location[1] >= height:
                         continue
-                    if new_box_location in self.obstacles:
+                    if new_box_location in obstacles:
                         continue
                     if new_box_location in new_robots:
                         continue
                     if new_box_location in new_boxes:
                         continue
 
+                    new_boxes = set(self.boxes)
                     new_boxes.remove(new_location)
                     new_boxes.add(new_box_location)
-                    new_moved_boxes.add(new_box_location)
+                    new_boxes = frozenset(new_boxes)
 
                 new_robots = list(self.robots)
                 new_robots[robot] = new_location
                 new_robots = tuple(new_robots)
 
                 new_state = SokobanState(str(robot) + " " + direction.name, self.gval + transition_cost, self,
-                                         self.width, self.height, new_robots, frozenset(new_boxes), self.storage,
-                                         self.obstacles)
+                                         width, height, new_robots, new_boxes, self.storage,
+                                         obstacles, level=self.level)
                 successors.append(new_state)
 
         return successors
 
     def hashable_state(self):
-        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
+        '''
+        Return a data item that can be used as a dictionary key to UNIQUELY represent a state.
+        With symmetric_robots, states whose robots stand on the same cells in a different order are the same:
+        the robots are all alike, so either state can reach a goal exactly when the other can. Each state still
+        keeps its own robots tuple, so the robot numbers in the actions of a path are those of its start state.
+        '''
+        if self.symmetric_robots:
+            return hash((tuple(sorted(self.robots)), self.boxes))
         return hash((self.robots, self.boxes))
 
-    def state_string(self):
-        '''Returns a string representation fo a state that can be printed to stdout.'''
-        map = []
-        for y in range(0, self.height):
-            row = []
-            for x in range(0, self.width):
-                row += [' ']
-            map += [row]
 
-        for storage_point in self.storage:
-            map[storage_point[1]][storage_point[0]] = '.'
-        for obstacle in self.obstacles:
-            map[obstacle[1]][obstacle[0]] = '#'
-        for i, robot in enumerate(self.robots):
-            if robot in self.storage:
-                map[robot[1]][robot[0]] = chr(ord('A') + i)
-            else:
-                map[robot[1]][robot[0]] = chr(ord('a') + i)
-        for box in self.boxes:
-            if box in self.storage:
-                map[box[1]][box[0]] = '*'
+class SokobanLevel:
+    '''
+    The static part of a Sokoban problem: the room dimensions, the storage points and the obstacles.
+    Cells are numbered row by row (cell = y * width + x) so that sets of cells can be packed into
+    integer bitmasks. Levels are shared between all the states of a problem, use SokobanLevel.get
+    to look one up. The cell tables are computed when they are first used.
+    '''
+    # the MAX_LEVELS most recently used levels, least recently used first; their tables (the walk
+    # distances are O(cells^2)) would otherwise pile up in long running processes solving many problems
+    MAX_LEVELS = 32
+    _levels = {}
+
+    def __init__(self, width, height, storage, obstacles):
+        '''
+        Creates a new Sokoban level.
+        @param width: The room's X dimension (excluding walls).
+        @param height: The room's Y dimension (excluding walls).
+        @param storage: A frozenset of all the storage points.
+        @param obstacles: A frozenset of all the impassable obstacles.
+        '''
+        self.width = width
+        self.height = height
+        self.storage = storage
+        self.obstacles = obstacles
+        self._storage_mask = None
+        self._obstacle_mask = None
+        self._neighbours = None
+        self._storage_order = None
+        self._push_distances = None
+        self._walk_distances = None
+        self._storage_reach = None
+        self._dead_mask = None
+        # Zobrist keys: random 64-bit numbers for a box on each cell and for each robot on each cell
+        self._zobrist_boxes = None
+        self.zobrist_robots = {}
+
+    @classmethod
+    def get(cls, width, height, storage, obstacles):
+        '''
+        Returns the (cached) level with the given dimensions, storage points and obstacles. Incomplete
+        levels (e.g. of a placeholder state whose fields are all None) are not cached.
+        '''
+        if width is None or height is None or storage is None or obstacles is None:
+            return cls(width, height, storage, obstacles)
+        key = (width, height, storage, obstacles)
+        level = cls._levels.pop(key, None)
+        if level is None:
+            level = cls(width, height, storage, obstacles)
+            if len(cls._levels) >= cls.MAX_LEVELS:
+                del cls._levels[next(iter(cls._levels))]
+        cls._levels[key] = level
+        return level
+
+    @classmethod
+    def of(cls, state):
+        '''Returns the level of any Sokoban state.'''
+        level = getattr(state, 'level', None)
+        if level is None:
+            level = cls.get(state.width, state.height, state.storage, state.obstacles)
+        return level
+
+    @property
+    def storage_mask(self):
+        '''Bitmask of the storage points.'''
+        if self._storage_mask is None:
+            self._storage_mask = self.mask(self.storage)
+        return self._storage_mask
+
+    @property
+    def obstacle_mask(self):
+        '''Bitmask of the obstacles.'''
+        if self._obstacle_mask is None:
+            self._obstacle_mask = self.mask(self.obstacles)
+        return self._obstacle_mask
+
+    @property
+    def neighbours(self):
+        '''
+        neighbours[d][cell] is the cell reached by moving from cell in direction DIRECTIONS[d], or -1 if that move
+        leaves the room or runs into an obstacle.
+        '''
+        if self._neighbours is None:
+            self._neighbours = tuple(tuple(self._neighbour(cell, direction)
+                                           for cell in range(self.width * self.height))
+                                     for direction in DIRECTIONS)
+        return self._neighbours
+
+    @property
+    def storage_order(self):
+        '''storage_order[storage_point] is the position of the storage point in the per-storage tables.'''
+        if self._storage_order is None:
+            self._storage_order = {storage_point: i for i, storage_point in enumerate(sorted(self.storage))}
+        return self._storage_order
+
+    @property
+    def zobrist_boxes(self):
+        '''The Zobrist keys, one per cell, of a box.'''
+        if self._zobrist_boxes is None:
+            self._zobrist_boxes = self._zobrist_keys(0)
+        return self._zobrist_boxes
+
+    def _zobrist_keys(self, table):
+        '''
+        @return: The Zobrist keys, one per cell, of the boxes (table 0) or of a robot (table robot + 1). Each table
+                 has a seed of its own, so its keys do not depend on which tables were made before, or by which thread.
+        '''
+        rnd = random.Random(384 + table)
+        return tuple(rnd.getrandbits(64) for cell in range(self.width * self.height))
+
+    def _neighbour(self, cell, direction):
+        x, y = direction.move(self.location(cell))
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return -1
+        neighbour = self.index((x, y))
+        if self.obstacle_mask >> neighbour & 1:
+            return -1
+        return neighbour
+
+    @property
+    def dead_mask(self):
+        '''
+        Bitmask of the "dead squares": free cells from which a box can never be pushed onto any storage point,
+        whatever the other boxes and robots do. Computed once per level by pulling a box backwards from every
+        storage point over the empty room.
+        '''
+        if self._dead_mask is None:
+            live = 0
+            for reach in self.storage_reach:
+                live |= reach
+            self._dead_mask = ((1 << (self.width * self.height)) - 1) & ~self.obstacle_mask & ~live
+        return self._dead_mask
+
+    @property
+    def storage_reach(self):
+        '''
+        A tuple with, for each storage point (in sorted order), the bitmask of the cells from which a box
+        can be pushed onto that storage point in the empty room.
+        '''
+        if self._storage_reach is None:
+            self._storage_reach = tuple(sum(1 << cell for cell, distance in enumerate(distances)
+                                            if distance != math.inf)
+                                        for distances in self.push_distances)
+        return self._storage_reach
+
+    @property
+    def push_distances(self):
+        '''
+        A tuple with, for each storage point (in sorted order), a tuple indexed by cell of the minimum number
+        of pushes needed to bring a box from that cell onto the storage point in the empty room (math.inf if
+        it can not be done). This never overestimates the moves needed by any robot.
+        '''
+        if self._push_distances is None:
+            self._push_distances = tuple(self._pull_distances(self.index(storage_point))
+                                         for storage_point in sorted(self.storage))
+        return self._push_distances
+
+    @property
+    def walk_distances(self):
+        '''
+        A tuple indexed by source cell of tuples indexed by target cell, holding the number of moves a robot
+        needs to walk from source to target around the obstacles (math.inf if target can not be reached).
+        '''
+        if self._walk_distances is None:
+            self._walk_distances = tuple(self._bfs_distances(cell) for cell in range(self.width * self.height))
+        return self._walk_distances
+
+    def _bfs_distances(self, source):
+        '''@return: The walking distance from source to every cell.'''
+        distances = [math.inf] * (self.width * self.height)
+        if self.obstacle_mask >> source & 1:
+            return tuple(distances)
+        distances[source] = 0
+        queue = [source]
+        for cell in queue:
+            for neighbours in self.neighbours:
+                neighbour = neighbours[cell]
+                if neighbour < 0 or distances[neighbour] != math.inf:
+                    continue
+                distances[neighbour] = distances[cell] + 1
+                queue.append(neighbour)
+        return tuple(distances)
+
+    def _pull_distances(self, target):
+        '''@return: The push distance from every cell to target, by pulling a box backwards from target.'''
+        distances = [math.inf] * (self.width * self.height)
+        distances[target] = 0
+        queue = [target]
+        for cell in queue:
+            for neighbours in self.neighbours:
+                # The box can come from the previous cell if the robot has room to stand behind it.
+                previous = neighbours[cell]
+                if previous < 0 or distances[previous] != math.inf or neighbours[previous] < 0:
+                    continue
+                distances[previous] = distances[cell] + 1
+                queue.append(previous)
+        return tuple(distances)
+
+    def index(self, location):
+        '''@return: The cell number of an (x, y) location.'''
+        return location[1] * self.width + location[0]
+
+    def location(self, cell):
+        '''@return: The (x, y) location of a cell number.'''
+        return (cell % self.width, cell // self.width)
+
+    def mask(self, locations):
+        '''@return: The bitmask with the bits of the given (x, y) locations set.'''
+        mask = 0
+        for location in locations:
+            mask |= 1 << self.index(location)
+        return mask
+
+    def locations(self, mask):
+        '''@return: A frozenset of the (x, y) locations whose bits are set in mask.'''
+        locations = []
+        while mask:
+            low_bit = mask & -mask
+            locations.append(self.location(low_bit.bit_length() - 1))
+            mask ^= low_bit
+        return frozenset(locations)
+
+    def robot_keys(self, robot):
+        '''@return: The Zobrist keys, one per cell, of the robot with the given index.'''
+        keys = self.zobrist_robots.get(robot)
+        if keys is None:
+            # threads racing here make equal tables, and setdefault keeps the first one
+            keys = self.zobrist_robots.setdefault(robot, self._zobrist_keys(robot + 1))
+        return keys
+
+    def zobrist(self, robot_cells, box_mask, symmetric_robots=False):
+        '''
+        @return: The Zobrist hash of a configuration: the XOR of the keys of its boxes and robots. With
+                 symmetric_robots every robot uses the keys of robot 0, so the order of the robots does not matter.
+        '''
+        key = 0
+        for robot, cell in enumerate(robot_cells):
+            key ^= self.robot_keys(0 if symmetric_robots else robot)[cell]
+        while box_mask:
+            low_bit = box_mask & -box_mask
+            key ^= self.zobrist_boxes[low_bit.bit_length() - 1]
+            box_mask ^= low_bit
+        return key
+
+    def reachable(self, cell, blocked_mask):
+        '''@return: The bitmask of the cells a robot on cell can walk to without entering a blocked cell.'''
+        reach = 1 << cell
+        queue = [cell]
+        for cell in queue:
+            for neighbours in self.neighbours:
+                neighbour = neighbours[cell]
+                if neighbour < 0 or (reach | blocked_mask) >> neighbour & 1:
+                    continue
+                reach |= 1 << neighbour
+                queue.append(neighbour)
+        return reach
+
+    def robot_region(self, robot_cell, box_mask):
+        '''@return: A key for the region a lone robot on robot_cell can walk to: the lowest cell of the region.'''
+        region = self.reachable(robot_cell, box_mask)
+        return (region & -region).bit_length() - 1
+
+    def walk_distances_from(self, cell, blocked_mask):
+        '''
+        @return: A list of (cell, distance) pairs, in breadth-first order, of the cells a robot on cell can walk
+                 to without entering a blocked cell.
+        '''
+        reach = 1 << cell
+        queue = [(cell, 0)]
+        for cell, distance in queue:
+            for neighbours in self.neighbours:
+                neighbour = neighbours[cell]
+                if neighbour < 0 or (reach | blocked_mask) >> neighbour & 1:
+                    continue
+                reach |= 1 << neighbour
+                queue.append((neighbour, distance + 1))
+        return queue
+
+    def walk(self, start, goal, blocked_mask):
+        '''
+        @return: The shortest list of direction indices (into DIRECTIONS) that walks a robot from start to goal
+                 without entering a blocked cell, or None if there is no such walk.
+        '''
+        previous = {start: None}
+        queue = [start]
+        for cell in queue:
+            if cell == goal:
+                path = []
+                while previous[cell] is not None:
+                    cell, d = previous[cell]
+                    path.append(d)
+                path.reverse()
+                return path
+            for d, neighbours in enumerate(self.neighbours):
+                neighbour = neighbours[cell]
+                if neighbour < 0 or neighbour in previous or blocked_mask >> neighbour & 1:
+                    continue
+                previous[neighbour] = (cell, d)
+                queue.append(neighbour)
+        return None
+
+
+class BitboardSokobanState(BaseSokobanState):
+    '''
+    A Sokoban state that packs the board into integers: each robot is stored as a cell number and all the
+    boxes as a single bitmask. The static data lives in a shared SokobanLevel. The robots, boxes, width,
+    height, storage and obstacles attributes are still available (decoded on access), so heuristics and
+    sokoban_goal_state work unchanged on either representation.
+
+    Each state also carries the 64-bit Zobrist hash of its configuration, which successors updates by XORing
+    the keys of the moved robot and box out and in. It is the hashable_state, so it can be stored in a
+    CompactClosedTable (SearchEngine(..., closed_type='compact')).
+    '''
+    __slots__ = ('level', 'robot_cells', 'box_mask', 'symmetric_robots', 'zobrist')
+
+    def __init__(self, action, gval, parent, level, robot_cells, box_mask, symmetric_robots=None, zobrist=None):
+        '''
+        Creates a new bitboard Sokoban state.
+        @param level: The SokobanLevel this state belongs to.
+        @param robot_cells: A tuple of the robots' cell numbers. Each robot is denoted by its index in the tuple.
+        @param box_mask: A bitmask of the cells holding a box.
+        @param symmetric_robots: As for SokobanState.
+        @param zobrist: The Zobrist hash of the configuration, computed from scratch if None.
+        '''
+        StateSpace.__init__(self, action, gval, parent)
+        self.level = level
+        self.robot_cells = robot_cells
+        self.box_mask = box_mask
+        if symmetric_robots is None:
+            symmetric_robots = getattr(parent, 'symmetric_robots', False)
+        self.symmetric_robots = symmetric_robots
+        if zobrist is None:
+            zobrist = level.zobrist(robot_cells, box_mask, symmetric_robots)
+        self.zobrist = zobrist
+
+    @classmethod
+    def from_state(cls, state, **options):
+        '''
+        @param options: Extra keyword arguments for the constructor of cls (e.g. normalize_robots).
+        @return: The bitboard equivalent of a SokobanState (e.g. one of PROBLEMS).
+        '''
+        level = SokobanLevel.get(state.width, state.height, state.storage, state.obstacles)
+        return cls(state.action, state.gval, state.parent, level,
+                   tuple(level.index(robot) for robot in state.robots), level.mask(state.boxes), **options)
+
+    @property
+    def robots(self):
+        return tuple(self.level.location(cell) for cell in self.robot_cells)
+
+    @property
+    def boxes(self):
+        return self.level.locations(self.box_mask)
+
+    def successors(self):
+        '''
+        Generates all the actions that can be performed from this state, and the states those actions will create.
+        Successors are produced in the same order and with the same actions as SokobanState.successors.
+        '''
+        successors = []
+        transition_cost = 1
+        level = self.level
+        robots = self.robot_cells
+        boxes = self.box_mask
+
+        box_keys = level.zobrist_boxes
+
+        for robot, cell in enumerate(robots):
+            robot_keys = level.robot_keys(0 if self.symmetric_robots else robot)
+            for d, neighbours in enumerate(level.neighbours):
+                new_cell = neighbours[cell]
+                if new_cell < 0 or new_cell in robots:
+                    continue
+
+                new_boxes = boxes
+                zobrist = self.zobrist ^ robot_keys[cell] ^ robot_keys[new_cell]
+                if boxes >> new_cell & 1:
+                    new_box_cell = neighbours[new_cell]
+                    if new_box_cell < 0 or new_box_cell in robots or boxes >> new_box_cell & 1:
+                        continue
+                    new_boxes = boxes ^ (1 << new_cell) ^ (1 << new_box_cell)
+                    zobrist ^= box_keys[new_cell] ^ box_keys[new_box_cell]
+
+                new_robots = robots[:robot] + (new_cell,) + robots[robot + 1:]
+                successors.append(self.child(robot, d, self.gval + transition_cost, new_robots, new_boxes, zobrist))
+
+        return successors
+
+    def child(self, robot, d, gval, robot_cells, box_mask, zobrist):
+        '''Creates the successor reached by moving robot in direction DIRECTIONS[d].'''
+        return BitboardSokobanState(str(robot) + " " + DIRECTIONS[d].name, gval, self, self.level, robot_cells,
+                                    box_mask, zobrist=zobrist)
+
+    def hashable_state(self):
+        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state: its Zobrist hash.'''
+        return self.zobrist
+
+
+class SokobanNodePool:
+    '''
+    The search tree of a PooledSokobanState search, kept as two flat arrays: for every state generated, the
+    number of its parent and the code of the action that created it (robot * 4 + direction index). The root
+    state is the only state object the pool holds on to, besides the numbers and hashes of the states on the
+    last path that path checking looked at (see path_hashes).
+    '''
+    __slots__ = ('root', 'root_action', 'parents', 'actions', 'path_nodes', 'path_keys', 'path_depth', 'path_counts')
+
+    def __init__(self, root, root_action):
+        self.root = root
+        self.root_action = root_action
+        self.parents = array('i', [-1])
+        self.actions = array('I', [0])
+        self.path_nodes = []
+        self.path_keys = []
+        self.path_depth = {}
+        self.path_counts = {}
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent, code):
+        '''Records a new state and returns its number.'''
+        self.parents.append(parent)
+        self.actions.append(code)
+        return len(self.parents) - 1
+
+    def state(self, node):
+        '''Rebuilds state number node by replaying the actions leading to it from the root.'''
+        nodes = []
+        while node > 0:
+            nodes.append(node)
+            node = self.parents[node]
+        state = self.root
+        for node in reversed(nodes):
+            state = state.replay(self.actions[node], node)
+        return state
+
+    def path_hashes(self, state):
+        '''
+        Returns a dictionary whose keys are the hashable_states of state and its ancestors (each mapped to the
+        number of those states it stands for). The last path asked for is kept, so when state is a child of one of
+        its states (as in a depth-first search, which backtracks to a state on its path and goes on from there)
+        the path is cut back and extended by state. Only a jump to another branch rebuilds the ancestors by
+        replaying.
+        '''
+        node = state.node
+        nodes = self.path_nodes
+        if nodes and nodes[-1] == node:
+            return self.path_counts
+        depth = self.path_depth.get(self.parents[node]) if node > 0 else None
+        if depth is None:
+            path = []
+            ancestor = self.state(node)
+            while True:
+                path.append((ancestor.node, ancestor.hashable_state()))
+                if ancestor.node == 0:
+                    break
+                ancestor = ancestor._parent
+            path.reverse()
+            self.path_nodes = [ancestor_node for ancestor_node, key in path]
+            self.path_keys = [key for ancestor_node, key in path]
+            self.path_depth = {ancestor_node: i for i, ancestor_node in enumerate(self.path_nodes)}
+            self.path_counts = path_counts = {}
+            for key in self.path_keys:
+                path_counts[key] = path_counts.get(key, 0) + 1
+            return path_counts
+        path_counts = self.path_counts
+        while len(nodes) > depth + 1:
+            del self.path_depth[nodes.pop()]
+            key = self.path_keys.pop()
+            if path_counts[key] == 1:
+                del path_counts[key]
             else:
-                map[box[1]][box[0]] = '$'
+                path_counts[key] = path_counts[key] - 1
+        key = state.hashable_state()
+        self.path_depth[node] = len(nodes)
+        nodes.append(node)
+        self.path_keys.append(key)
+        path_counts[key] = path_counts.get(key, 0) + 1
+        return path_counts
 
-        for y in range(0, self.height):
-            map[y] = ['#'] + map[y]
-            map[y] = map[y] + ['#']
-        map = ['#' * (self.width + 2)] + map
-        map = map + ['#' * (self.width + 2)]
 
-        s = ''
-        for row in map:
-            for char in row:
-                s += char
-            s += '\n'
+class PooledSokobanState(BitboardSokobanState):
+    '''
+    A bitboard Sokoban state that does not keep its ancestors alive. The states of a search share a
+    SokobanNodePool holding each state's parent number and action code, and a state only refers to its parent
+    object until it is expanded (long enough for heuristics and prune functions to look at it). The parent and
+    action attributes are computed on access: a parent that has been let go is rebuilt from the pool by
+    replaying the actions from the root, and the action string is formatted from its code. So only the states
+    on OPEN (and their parents) stay in memory, and paths are reconstructed, e.g. by print_path, only when
+    they are asked for.
+    '''
+    __slots__ = ('pool', 'node', '_parent')
 
-        return s
+    def __init__(self, action, gval, parent, level, robot_cells, box_mask, symmetric_robots=None, zobrist=None,
+                 pool=None, node=0):
+        '''
+        Creates a new pooled Sokoban state.
+        @param action: The action of a start state (e.g. "START"), ignored for other states.
+        @param pool: The SokobanNodePool of the search, or None to start a new one with this state as its root.
+        @param node: The number of this state in the pool.
+        '''
+        self.gval = gval
+        self.level = level
+        self.robot_cells = robot_cells
+        self.box_mask = box_mask
+        if symmetric_robots is None:
+            symmetric_robots = getattr(parent, 'symmetric_robots', False)
+        self.symmetric_robots = symmetric_robots
+        if zobrist is None:
+            zobrist = level.zobrist(robot_cells, box_mask, symmetric_robots)
+        self.zobrist = zobrist
+        if pool is None:
+            pool = SokobanNodePool(self, action)
+        self.pool = pool
+        self.node = node
+        self.index = node
+        self._parent = parent
 
-    def print_state(self):
+    @property
+    def action(self):
+        if self.node == 0:
+            return self.pool.root_action
+        robot, d = divmod(self.pool.actions[self.node], 4)
+        return str(robot) + " " + DIRECTIONS[d].name
+
+    @property
+    def parent(self):
+        if self.node == 0:
+            return None
+        if self._parent is None:
+            self._parent = self.pool.state(self.pool.parents[self.node])
+        return self._parent
+
+    def has_path_cycle(self):
         '''
-        Prints the string representation of the state. ASCII art FTW!
+        Returns true if self is equal to a prior state on its path. The ancestors' hashes come from the pool
+        (see SokobanNodePool.path_hashes), so checking a path does not rebuild it for every state.
+        '''
+        if self.node == 0:
+            return False
+        return self.hashable_state() in self.pool.path_hashes(self.parent)
+
+    def successors(self):
+        successors = BitboardSokobanState.successors(self)
+        # the successors refer to this state, which no longer needs its own parent
+        self._parent = None
+        return successors
+
+    def child(self, robot, d, gval, robot_cells, box_mask, zobrist):
+        node = self.pool.add(self.node, 4 * robot + d)
+        return PooledSokobanState(None, gval, self, self.level, robot_cells, box_mask, zobrist=zobrist,
+                                  pool=self.pool, node=node)
+
+    def replay(self, code, node):
+        '''Rebuilds the successor with the given action code, which is state number node of the pool.'''
+        robot, d = divmod(code, 4)
+        neighbours = self.level.neighbours[d]
+        new_cell = neighbours[self.robot_cells[robot]]
+        new_boxes = self.box_mask
+        if new_boxes >> new_cell & 1:
+            new_boxes = new_boxes ^ (1 << new_cell) ^ (1 << neighbours[new_cell])
+        new_robots = self.robot_cells[:robot] + (new_cell,) + self.robot_cells[robot + 1:]
+        return PooledSokobanState(None, self.gval + 1, self, self.level, new_robots, new_boxes, pool=self.pool,
+                                  node=node)
+
+
+class SokobanPushState(BitboardSokobanState):
+    '''
+    A state of the push-level ("macro move") Sokoban search space of a level with a single robot. Each action
+    walks the robot, by a shortest path, to a cell next to a box and pushes the box, so every successor changes
+    the box configuration and the walks in between are never searched. The cost of an action is the length of
+    its walk plus one for the push, so gvals are the same as in the step-level space. A state keeps the exact
+    robot position (after the last push) and its push; the walk is only recomputed by step_path.
+
+    Levels with several robots are refused: a robot may have to walk ahead of (or out of the way of) a push by
+    another, which pushes alone can not express. Search their BitboardSokobanState instead.
+
+    With normalize_robots, hashable_state identifies the robot by the region it can walk to rather than by its
+    exact cell, so full cycle checking treats pushes that lead to the same configuration from different places
+    in a region as the same state. This shrinks the search space drastically, but solutions are no longer
+    guaranteed to have the fewest moves.
+    '''
+    __slots__ = ('push', 'normalize_robots')
+
+    def __init__(self, action, gval, parent, level, robot_cells, box_mask, push=None, normalize_robots=None,
+                 symmetric_robots=None, zobrist=None):
+        '''
+        Creates a new push-level state.
+        @param push: None for a start state, else the (robot, cell, direction index) of the push that created
+                     this state: the robot walked from its cell in the parent to cell, then pushed.
+        @param normalize_robots: Whether hashable_state normalizes the robot to its region. None (the default)
+                                 inherits the setting of the parent, i.e. of the start state.
+        @param symmetric_robots: As for SokobanState.
+        @param zobrist: As for BitboardSokobanState.
+        '''
+        if parent is None and len(robot_cells) != 1:
+            raise ValueError("SokobanPushState needs a level with a single robot, not " + str(len(robot_cells)))
+        BitboardSokobanState.__init__(self, action, gval, parent, level, robot_cells, box_mask, symmetric_robots,
+                                      zobrist)
+        self.push = push
+        if normalize_robots is None:
+            normalize_robots = parent is not None and parent.normalize_robots
+        self.normalize_robots = normalize_robots
+
+    def successors(self):
+        '''
+        Generates all the pushes the robot can walk to, and the states those pushes will create.
         '''
+        successors = []
+        transition_cost = 1
+        level = self.level
+        cell, = self.robot_cells
+        boxes = self.box_mask
+
+        box_keys = level.zobrist_boxes
+        robot_keys = level.robot_keys(0)
+
+        for walk_cell, distance in level.walk_distances_from(cell, boxes):
+            for d, neighbours in enumerate(level.neighbours):
+                box = neighbours[walk_cell]
+                if box < 0 or not boxes >> box & 1:
+                    continue
+                new_box_cell = neighbours[box]
+                if new_box_cell < 0 or boxes >> new_box_cell & 1:
+                    continue
+                new_boxes = boxes ^ (1 << box) ^ (1 << new_box_cell)
+                zobrist = self.zobrist ^ robot_keys[cell] ^ robot_keys[box] ^ box_keys[box] ^ box_keys[new_box_cell]
+                successors.append(SokobanPushState("0 " + DIRECTIONS[d].name + " from " +
+                                                   str(level.location(walk_cell)),
+                                                   self.gval + distance + transition_cost, self, level,
+                                                   (box,), new_boxes, (0, walk_cell, d), zobrist=zobrist))
+
+        return successors
+
+    def hashable_state(self):
+        '''
+        Return a data item that can be used as a dictionary key to represent a state: the exact robot cell and
+        the boxes, or with normalize_robots, the robot's region (see SokobanLevel.robot_region) and the boxes.
+        '''
+        if self.normalize_robots:
+            return hash((self.level.robot_region(self.robot_cells[0], self.box_mask), self.box_mask))
+        return BitboardSokobanState.hashable_state(self)
+
+    def step_path(self):
+        '''
+        Reconstructs the step-level path to this state.
+        @return: The BitboardSokobanState equivalent of this state, whose parents are the single robot steps
+                 (walks and pushes) leading to it from the start state.
+        '''
+        pushes = []
+        state = self
+        while state.parent is not None:
+            pushes.append(state)
+            state = state.parent
+        level = self.level
+        step = BitboardSokobanState(state.action, state.gval, None, level, state.robot_cells, state.box_mask)
+        for state in reversed(pushes):
+            robot, cell, d = state.push
+            occupied = step.box_mask
+            for robot_cell in step.robot_cells:
+                occupied |= 1 << robot_cell
+            start = step.robot_cells[robot]
+            for direction in level.walk(start, cell, occupied & ~(1 << start)) + [d]:
+                action = str(robot) + " " + DIRECTIONS[direction].name
+                step = next(succ for succ in step.successors() if succ.action == action)
+        return step
+
+
+class SokobanPullState(StateSpace):
+    '''
+    A state of the reverse ("pull") Sokoban search, which starts from the goal configurations and pulls boxes
+    away from the storage points. A state is a box configuration together with the region of cells the puller
+    can walk to. Every pull undoes a push, so each state remembers the push that leads from its configuration
+    back towards the goal. The gval counts pulls, i.e. pushes, not robot moves.
+    '''
+    __slots__ = ('level', 'box_mask', 'region', 'push')
+
+    def __init__(self, action, gval, parent, level, box_mask, region, push):
+        '''
+        Creates a new pull state.
+        @param level: The SokobanLevel of the problem.
+        @param box_mask: A bitmask of the cells holding a box.
+        @param region: A bitmask of the cells the puller can reach.
+        @param push: None for a goal configuration, else the (box cell, direction index) of the push that turns
+                     this configuration into the parent's.
+        '''
+        StateSpace.__init__(self, action, gval, parent)
+        self.level = level
+        self.box_mask = box_mask
+        self.region = region
+        self.push = push
+
+    @property
+    def boxes(self):
+        return self.level.locations(self.box_mask)
+
+    def successors(self):
+        '''
+        Generates all the pulls the puller can make from anywhere in its region: standing next to a box, it
+        steps away from it and drags the box onto the cell it was standing on.
+        '''
+        successors = []
+        transition_cost = 1
+        level = self.level
+        boxes = self.box_mask
+        region = self.region
+
+        while region:
+            low_bit = region & -region
+            region ^= low_bit
+            cell = low_bit.bit_length() - 1
+            for d, neighbours in enumerate(level.neighbours):
+                box = neighbours[cell]
+                if box < 0 or not boxes >> box & 1:
+                    continue
+                back = level.neighbours[(d + 2) % 4][cell]
+                if back < 0 or boxes >> back & 1:
+                    continue
+                new_boxes = boxes ^ (1 << box) ^ (1 << cell)
+                # going forward, a robot on back pushes the box from cell in direction d
+                successors.append(SokobanPullState("pull " + str(level.location(box)) + " " + DIRECTIONS[d].name,
+                                                   self.gval + transition_cost, self, level, new_boxes,
+                                                   level.reachable(back, new_boxes), (cell, d)))
+
+        return successors
+
+    def hashable_state(self):
+        '''The box configuration and the puller's region (identified by its lowest cell).'''
+        return hash((self.box_mask, self.region & -self.region))
+
+    def print_state(self):
         print("ACTION was " + self.action)
-        print(self.state_string())
+        print("boxes: {}".format(sorted(self.boxes)))
+
+
+def sokoban_pull_start_states(state):
+    '''
+    Returns the start states of the reverse search for a Sokoban problem: every way of putting its boxes on
+    storage points, combined with every connected region of free cells the puller could be in.
+    '''
+    level = SokobanLevel.of(state)
+    free = ((1 << (level.width * level.height)) - 1) & ~level.obstacle_mask
+    starts = []
+    for storage_points in itertools.combinations(sorted(level.storage), len(state.boxes)):
+        box_mask = level.mask(storage_points)
+        unassigned = free & ~box_mask
+        while unassigned:
+            cell = (unassigned & -unassigned).bit_length() - 1
+            region = level.reachable(cell, box_mask)
+            unassigned &= ~region
+            starts.append(SokobanPullState("GOAL", 0, None, level, box_mask, region, None))
+    return starts
+
+
+def sokoban_box_key(state):
+    '''Returns the box configuration of a forward or pull state as a bitmask, for meeting in the middle.'''
+    box_mask = getattr(state, 'box_mask', None)
+    if box_mask is None:
+        box_mask = SokobanLevel.of(state).mask(state.boxes)
+    return box_mask
+
+
+def sokoban_join(forward_state, pull_state):
+    '''
+    Joins the two halves of a bidirectional search that met on the same box configuration: replays the pushes
+    recorded along pull_state's path back to its goal configuration, starting from forward_state and walking a
+    robot to the right place before each push.
+    @return: The resulting goal state, whose path runs through forward_state, or None if a push can not be
+             replayed (e.g. no robot can reach the cell behind the box).
+    '''
+    level = SokobanLevel.of(forward_state)
+    state = forward_state
+    node = pull_state
+    while node.push is not None:
+        box, d = node.push
+        pusher = level.neighbours[(d + 2) % 4][box]
+        robot_cells = [level.index(robot) for robot in state.robots]
+        occupied = sokoban_box_key(state)
+        for cell in robot_cells:
+            occupied |= 1 << cell
+        if occupied >> level.neighbours[d][box] & 1:
+            # another robot stands where the box has to go
+            return None
+        best = None
+        for robot, cell in enumerate(robot_cells):
+            path = level.walk(cell, pusher, occupied & ~(1 << cell))
+            if path is not None and (best is None or len(path) < len(best[1])):
+                best = (robot, path)
+        if best is None:
+            return None
+        robot, path = best
+        for step in path + [d]:
+            action = str(robot) + " " + DIRECTIONS[step].name
+            state = next(succ for succ in state.successors() if succ.action == action)
+        node = node.parent
+    if not sokoban_goal_state(state):
+        return None
+    return state
+
 
 def sokoban_goal_state(state):
     '''Returns True if we have reached a goal state'''
     '''INPUT: a sokoban state'''
     '''OUTPUT: True (if goal) or False (if not)'''
+    if isinstance(state, BitboardSokobanState):
+        return not state.box_mask & ~state.level.storage_mask
     for box in state.boxes:
         if box not in state.storage:
             return False
@@ -327,6 +1181,7 @@ UP = Direction("up", (0, -1))
 RIGHT = Direction("right", (1, 0))
 DOWN = Direction("down", (0, 1))
 LEFT = Direction("left", (-1, 0))
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
 
 
 
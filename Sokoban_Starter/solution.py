@@ -8,15 +8,26 @@
 import os  # for time functions
 import math  # for infinity
 from search import *  # for search engines
-from sokoban import sokoban_goal_state, SokobanState, Direction, PROBLEMS  # for Sokoban specific classes and problems
+from sokoban import sokoban_goal_state, SokobanState, SokobanLevel, Direction, PROBLEMS
+from sokoban import sokoban_pull_start_states, sokoban_box_key, sokoban_join  # for Sokoban specific classes and problems
 
-def corner_obs_deadlock(box, state):
+def get_level(state):
+    '''return the shared static level data (dead squares etc.) of a state'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: the SokobanLevel, computed once per (width, height, storage, obstacles)'''
+    return SokobanLevel.of(state)
+
+def dead_square_deadlock(box, level):
+    '''determine if box sits on a dead square, i.e. a square from which it can never reach any storage'''
+    '''INPUT: box, level'''
+    '''OUTPUT: true or false'''
+    return level.dead_mask >> level.index(box) & 1 == 1
+
+def corner_obs_deadlock(box, state, deadlock_positions):
     '''determine if box's x and y axis is next to a obstacle or wall'''
-    '''INPUT: box, storage'''
+    '''INPUT: box, state, set of obstacle and box positions'''
     '''OUTPUT: True or False, True for corner deadlock'''
 
-    deadlock_positions = state.obstacles.union(state.boxes)
-    
     up = (box[0], box[1]-1) 
     down = (box[0], box[1]+1)
     left = (box[0]-1, box[1])
@@ -55,17 +66,19 @@ def is_against_top_down_wall(box, state):
 def is_deadlock(state, avaliable_box, avaliable_storage):
     '''only look at the boxes that are not in storage position already
     check 4 deadlock senario
-    1. xy side is all wall
+    1. box is on a precomputed dead square (e.g. a corner of walls)
     2. xy side is a wall and a box, a wall and a obstacle, or a obstacle and obstacle, or a obstacle and a box or two box
     3. is next to verticle side of a wall and there is no storage on that side
     4. is next to horizonal side of a wall and there is no storage on that side
     true to indicate current position is in deadlock'''
     '''INPUT: state, avaliable_box, avaliable_storage'''
     '''OUTPUT: true or false'''
+    level = get_level(state)
+    deadlock_positions = state.obstacles.union(state.boxes)
     for box in avaliable_box:
-        if wall_corner_deadlock(box, state):
+        if dead_square_deadlock(box, level):
             return True
-        elif corner_obs_deadlock(box, state):
+        elif corner_obs_deadlock(box, state, deadlock_positions):
             return True
         elif vertical_deadlock(box, state, avaliable_storage):
             return True
@@ -73,10 +86,94 @@ def is_deadlock(state, avaliable_box, avaliable_storage):
             return True
     return False
 
-if 'prev_state' not in globals():
-    prev_state = None
+def get_box_mask(state, level):
+    '''return the bitmask of the cells of a state that hold a box'''
+    '''INPUT: a sokoban state, its level'''
+    '''OUTPUT: integer bitmask, see SokobanLevel.mask'''
+    box_mask = getattr(state, 'box_mask', None)
+    if box_mask is None:
+        box_mask = level.mask(state.boxes)
+    return box_mask
+
+def is_blocked(level, box_mask, cell, axis, walls):
+    '''determine if the box on cell can not be pushed along an axis (0 for left/right, 1 for up/down).
+    the box is blocked if there is a wall on one side, dead squares on both sides, or a box on one side that
+    is itself blocked along the other axis. boxes in walls are being checked further up and count as walls'''
+    '''INPUT: level, box_mask, cell, axis, walls'''
+    '''OUTPUT: true or false'''
+    # level.neighbours is ordered UP, RIGHT, DOWN, LEFT
+    if axis == 0:
+        sides = (level.neighbours[3][cell], level.neighbours[1][cell])
+    else:
+        sides = (level.neighbours[0][cell], level.neighbours[2][cell])
+
+    if sides[0] < 0 or sides[1] < 0:
+        return True
+    if level.dead_mask >> sides[0] & 1 and level.dead_mask >> sides[1] & 1:
+        return True
+
+    walls.add(cell)
+    blocked = False
+    for side in sides:
+        if side in walls or (box_mask >> side & 1 and is_blocked(level, box_mask, side, 1 - axis, walls)):
+            blocked = True
+            break
+    walls.discard(cell)
+    return blocked
+
+def frozen_deadlock(level, box_mask):
+    '''determine if a box that is not on storage can never be moved again: it is part of a 2x2 block of
+    boxes and walls, or it is frozen against a wall by other frozen boxes'''
+    '''INPUT: level, box_mask'''
+    '''OUTPUT: true or false'''
+    loose_boxes = box_mask & ~level.storage_mask
+    while loose_boxes:
+        low_bit = loose_boxes & -loose_boxes
+        loose_boxes ^= low_bit
+        cell = low_bit.bit_length() - 1
+        if is_blocked(level, box_mask, cell, 0, set()) and is_blocked(level, box_mask, cell, 1, set()):
+            return True
+    return False
+
+def find_augmenting_path(cell, storage_reach, match, seen):
+    '''try to give the box on cell a storage point it can reach, moving other boxes to other storage'''
+    '''INPUT: box cell, per storage reach masks, storage -> box cell matching, storage points already tried'''
+    '''OUTPUT: true if the matching was extended'''
+    for index, reach in enumerate(storage_reach):
+        if reach >> cell & 1 and index not in seen:
+            seen.add(index)
+            if match[index] < 0 or find_augmenting_path(match[index], storage_reach, match, seen):
+                match[index] = cell
+                return True
+    return False
+
+def bipartite_deadlock(level, box_mask):
+    '''determine if the boxes can not all be sent to different storage points they can still reach'''
+    '''INPUT: level, box_mask'''
+    '''OUTPUT: true if there is no perfect matching of boxes to reachable storage'''
+    storage_reach = level.storage_reach
+    match = [-1] * len(storage_reach)
+    while box_mask:
+        low_bit = box_mask & -box_mask
+        box_mask ^= low_bit
+        if not find_augmenting_path(low_bit.bit_length() - 1, storage_reach, match, set()):
+            return True
+    return False
+
+def sokoban_deadlock(state):
+    '''dynamic deadlock detection, meant to be plugged into the search engine as init_search(prune_fn=...)
+    so that dead states never enter OPEN. only boxes matter, so states where the robot moved without
+    pushing are never dead if their parent was not'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: true if the state is a frozen or bipartite deadlock'''
+    level = get_level(state)
+    box_mask = get_box_mask(state, level)
+    if state.parent is not None and get_box_mask(state.parent, level) == box_mask:
+        return False
+    return frozen_deadlock(level, box_mask) or bipartite_deadlock(level, box_mask)
+
 if 'prev_cal' not in globals():
-    prev_cal = None
+    prev_cal = (None, None, None)
 
 def heur_alternate(state):
     # IMPLEMENT
@@ -84,59 +181,85 @@ def heur_alternate(state):
     '''INPUT: a sokoban state'''
     '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
     ''' 1. check deadlock conditions, return directly
-            a. 4 corners of wall
+            a. dead squares of the level (corners, walls without storage), precomputed once
             b. xy obstructed by box and obstacle
             c. y obstructed by box and obstacle and left or right wall
             d. x obstructed by box and obstacle and top or down wall
             e. next to left right side wall with no storage on side
             f. next to top down side wall with no storage on side
         2. one storage position can only contain one box. so check for avaliable storage everytime
-        3. precomputation. return directly if the same composition as before
+        3. precomputation. return directly if the same composition (of the same level) as before
         4. add in the computation for length from robot to box
-        5. add in computation for obstruction, +2 for every obstruction on the route'''
+        5. distances come from the level's BFS tables, so obstacles are walked around (boxes and robots,
+           which move, are not)'''
     
-    global prev_state
+    # the (level, boxes, value) memo is a single tuple so that it is read and replaced
+    # atomically when several searches run in threads
     global prev_cal
 
-    if prev_state == state.boxes:
-        return prev_cal
-    else:
-        prev_state = state.boxes
-        
+    level = get_level(state)
+    prev_level, prev_boxes, prev_value = prev_cal
+    if prev_level is level and prev_boxes == state.boxes:
+        return prev_value
+
+    value = alternate_value(state)
+    prev_cal = (level, state.boxes, value)
+    return value
+
+def alternate_value(state):
+    '''the value of heur_alternate, computed from scratch'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: math.inf for a deadlock, else the better manhattan distance'''
     avaliable_box = list(state.boxes - state.storage)
     avaliable_storage = list(state.storage - state.boxes)
 
     if is_deadlock(state, avaliable_box, avaliable_storage):
-        prev_cal = math.inf
-        return prev_cal
-    else:
-        prev_cal = heur_better_mahanttan_distance(state, avaliable_box, avaliable_storage)
-        return prev_cal
+        return math.inf
+    return heur_better_mahanttan_distance(state, avaliable_box, avaliable_storage)
+
+def boxes_unchanged(state, parent):
+    '''determine if a move left the boxes where they were, i.e. only a robot moved'''
+    '''INPUT: a sokoban state and its parent'''
+    '''OUTPUT: true if the two states have the same boxes'''
+    box_mask = getattr(state, 'box_mask', None)
+    if box_mask is not None:
+        return box_mask == parent.box_mask
+    # SokobanState.successors hands the parent's frozenset on to robot-only moves
+    return state.boxes is parent.boxes
+
+class AlternateHeuristic(IncrementalHeuristic):
+    '''heur_alternate for the search engine's incremental protocol (pass AlternateHeuristic() as heur_fn): the
+    value only changes when a box is pushed, so robot-only moves take their parent's value and the value is
+    computed from scratch after a push. unlike the single-entry prev_cal memo this never misses when siblings
+    alternate'''
+
+    def initial(self, state):
+        value = alternate_value(state)
+        return value, value
+
+    def update(self, state, parent, parent_value):
+        if boxes_unchanged(state, parent):
+            return parent_value, parent_value
+        return self.initial(state)
 
 
 def heur_better_mahanttan_distance(state, avaliable_box, avaliable_storage):
     '''determine the number of steps used for the better manhattan distance calculation
-    include the distance from robot to box and also the obstacle step difference'''
+    include the distance from robot to box and the distance from box to storage, both looked up in the
+    level's precomputed distance tables so that walls and obstacles are walked around. boxes and robots in
+    the way are left out on purpose: they move, and adding steps for them on top of the tables (+2 for each
+    one on the manhattan path, as before) made the searches solve fewer problems'''
     '''INPUT: state, avaliable_box, avaliable_storage'''
     '''OUTPUT: a numeric value that serves as an better estimate of the distance of the state to the goal'''
+    level = get_level(state)
+    walk_distances = [level.walk_distances[level.index(robot)] for robot in state.robots]
+    push_distances = [level.push_distances[level.storage_order[storage]] for storage in avaliable_storage]
     total_dist = 0
 
-    robot_to_box_dist = {}
     for box in avaliable_box:
-        min_dist_from_robot = math.inf
-        for robot in state.robots:
-            robot_box_pair = (robot, box)
-            if robot_box_pair not in robot_to_box_dist:
-                robot_to_box_dist[robot_box_pair] = mahattan_distance(robot, box) + obstacle_count(robot, box, state)
-            min_dist_from_robot = min(min_dist_from_robot, robot_to_box_dist[robot_box_pair])
-        
-        min_dist_to_storage = math.inf
-        for storage in avaliable_storage:
-            box_storage_pair = (box, storage)
-            if box_storage_pair not in robot_to_box_dist:  
-                robot_to_box_dist[box_storage_pair] = mahattan_distance(box, storage) + obstacle_count(box, storage, state)
-            min_dist_to_storage = min(min_dist_to_storage, robot_to_box_dist[box_storage_pair])
-        
+        cell = level.index(box)
+        min_dist_from_robot = min(distances[cell] for distances in walk_distances)
+        min_dist_to_storage = min((distances[cell] for distances in push_distances), default=math.inf)
         total_dist += min_dist_from_robot + min_dist_to_storage
 
     return total_dist
@@ -164,6 +287,171 @@ def heur_manhattan_distance(state):
         sum_dist += dist
     return sum_dist # CHANGE THIS
 
+def hungarian_add_row(cost, u, v, match, row):
+    '''one phase of the hungarian algorithm: assign row to a column, re-assigning other rows along a shortest
+    augmenting path. u and v are the row and column potentials, match[column] is the row assigned to that
+    column. all arrays are indexed from 1, index 0 is the algorithm's scratch column'''
+    '''INPUT: square cost matrix (indexed from 0), u, v, match, row to add'''
+    '''OUTPUT: None, u, v and match are updated in place'''
+    size = len(cost)
+    min_reduced = [math.inf] * (size + 1)
+    way = [0] * (size + 1)
+    used = [False] * (size + 1)
+    match[0] = row
+    column = 0
+    while match[column] != 0:
+        used[column] = True
+        current_row = match[column]
+        current_cost = cost[current_row - 1]
+        delta = math.inf
+        next_column = 0
+        for j in range(1, size + 1):
+            if not used[j]:
+                reduced = current_cost[j - 1] - u[current_row] - v[j]
+                if reduced < min_reduced[j]:
+                    min_reduced[j] = reduced
+                    way[j] = column
+                if min_reduced[j] < delta:
+                    delta = min_reduced[j]
+                    next_column = j
+        for j in range(size + 1):
+            if used[j]:
+                u[match[j]] += delta
+                v[j] -= delta
+            else:
+                min_reduced[j] -= delta
+        column = next_column
+    while column != 0:
+        previous_column = way[column]
+        match[column] = match[previous_column]
+        column = previous_column
+
+class BoxMatching:
+    '''a min-cost perfect matching of boxes (rows) to storage points (columns), kept together with its
+    hungarian potentials so that it can be repaired in O(n^2) when a single box moves'''
+
+    def __init__(self, level, box_mask):
+        # the level's tables rather than the level, so that cached matchings do not keep levels alive
+        self.push_distances = level.push_distances
+        self.unreachable = level.width * level.height * (len(level.push_distances) + 1)
+        self.box_mask = box_mask
+        storage_count = len(level.push_distances)
+        # cells of the boxes, padded with None (free rows) when there are more storage points than boxes
+        self.rows = [None] * storage_count
+        self.cost = [[0] * storage_count for _ in range(storage_count)]
+        row = 0
+        while box_mask:
+            low_bit = box_mask & -box_mask
+            box_mask ^= low_bit
+            self.rows[row] = low_bit.bit_length() - 1
+            self.cost[row] = self.cost_row(self.rows[row])
+            row += 1
+        self.u = [0] * (storage_count + 1)
+        self.v = [0] * (storage_count + 1)
+        self.match = [0] * (storage_count + 1)
+        for row in range(1, storage_count + 1):
+            hungarian_add_row(self.cost, self.u, self.v, self.match, row)
+
+    def cost_row(self, cell):
+        '''push distances from cell to every storage point, unreachable storage gets a cost larger than any
+        matching that only uses reachable storage'''
+        return [self.unreachable if distances[cell] == math.inf else distances[cell]
+                for distances in self.push_distances]
+
+    def moved(self, box_mask):
+        '''return a new matching for box_mask, which differs from this one by exactly one box'''
+        child = BoxMatching.__new__(BoxMatching)
+        child.push_distances = self.push_distances
+        child.unreachable = self.unreachable
+        child.box_mask = box_mask
+        old_cell = (self.box_mask & ~box_mask).bit_length() - 1
+        new_cell = (box_mask & ~self.box_mask).bit_length() - 1
+        row = self.rows.index(old_cell)
+        child.rows = list(self.rows)
+        child.rows[row] = new_cell
+        child.cost = list(self.cost)
+        child.cost[row] = child.cost_row(new_cell)
+        child.u = list(self.u)
+        child.v = list(self.v)
+        child.match = list(self.match)
+        # only the moved box's row changed: unassign it and run a single hungarian phase for it
+        child.match[child.match.index(row + 1, 1)] = 0
+        hungarian_add_row(child.cost, child.u, child.v, child.match, row + 1)
+        return child
+
+    def total_cost(self):
+        '''the cost of the matching, math.inf if some box can not reach any free storage'''
+        total = 0
+        for column in range(1, len(self.match)):
+            total += self.cost[self.match[column] - 1][column - 1]
+        if total >= self.unreachable:
+            return math.inf
+        return total
+
+# the MATCHING_CACHE_SIZE most recently used matchings, least recently used first, keyed by the level's
+# (width, height, storage, obstacles) and the box mask. a few thousand are enough to repair the matching of
+# a child from its parent's, and the keys do not keep levels alive
+MATCHING_CACHE_SIZE = 4096
+matching_cache = {}
+
+def cached_matching(key):
+    '''return the cached matching of key (None if there is none), now the most recently used'''
+    matching = matching_cache.pop(key, None)
+    if matching is not None:
+        matching_cache[key] = matching
+    return matching
+
+def heur_min_matching(state):
+    '''admissible sokoban heuristic: min-cost perfect matching of boxes to storage points'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+    ''' every box needs its own storage point and at least as many pushes as its push distance to it in the
+        empty room, so the cheapest assignment of boxes to distinct storage points is a lower bound.
+        recent matchings are cached per box configuration, and the matching of a child is repaired from its
+        parent's when a single box was pushed instead of being solved from scratch. searches can use
+        MatchingHeuristic instead, whose nodes carry their matchings.'''
+    level = get_level(state)
+    level_key = (level.width, level.height, level.storage, level.obstacles)
+    box_mask = get_box_mask(state, level)
+    matching = cached_matching((level_key, box_mask))
+    if matching is None:
+        if len(state.boxes) > len(state.storage):
+            return math.inf
+        parent_matching = None
+        if state.parent is not None:
+            parent_matching = cached_matching((level_key, get_box_mask(state.parent, level)))
+        if parent_matching is not None and bin(parent_matching.box_mask ^ box_mask).count('1') == 2:
+            matching = parent_matching.moved(box_mask)
+        else:
+            matching = BoxMatching(level, box_mask)
+        if len(matching_cache) >= MATCHING_CACHE_SIZE:
+            del matching_cache[next(iter(matching_cache))]
+        matching_cache[(level_key, box_mask)] = matching
+    return matching.total_cost()
+
+class MatchingHeuristic(IncrementalHeuristic):
+    '''heur_min_matching for the search engine's incremental protocol (pass MatchingHeuristic() as heur_fn):
+    every node keeps its BoxMatching, robot-only moves reuse their parent's and a push repairs it for the
+    single box that moved, in O(n^2) instead of the O(n^3) of a new matching'''
+
+    def initial(self, state):
+        level = get_level(state)
+        if len(state.boxes) > len(state.storage):
+            return math.inf, None
+        matching = BoxMatching(level, get_box_mask(state, level))
+        return matching.total_cost(), matching
+
+    def update(self, state, parent, parent_matching):
+        if parent_matching is None:
+            return self.initial(state)
+        if boxes_unchanged(state, parent):
+            return parent_matching.total_cost(), parent_matching
+        box_mask = get_box_mask(state, get_level(state))
+        if bin(parent_matching.box_mask ^ box_mask).count('1') != 2:
+            return self.initial(state)
+        matching = parent_matching.moved(box_mask)
+        return matching.total_cost(), matching
+
 def fval_function(sN, weight):
     # IMPLEMENT
     """
@@ -178,80 +466,66 @@ def fval_function(sN, weight):
     return fval #CHANGE THIS
 
 # SEARCH ALGORITHMS
-def weighted_astar(initial_state, heur_fn, weight, timebound):
+def weighted_astar(initial_state, heur_fn, weight, timebound, deadline=None):
     # IMPLEMENT    
     '''Provides an implementation of weighted a-star, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state, a timebound (number of seconds) and optionally
+    a deadline shared with the caller (see search_deadline)'''
     '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
     '''implementation of weighted astar algorithm'''
-    start_time = os.times()[4]
-    end_time = os.times()[4] + timebound
+    deadline = search_deadline(timebound, deadline)
 
     se = SearchEngine('custom', 'full')
     wrapped_fval_function = lambda sN: fval_function(sN, weight)
-    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=wrapped_fval_function)
-    final, stats = se.search(timebound = (end_time - os.times()[4]), costbound=(math.inf, math.inf, math.inf))
+    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=wrapped_fval_function,
+                   prune_fn=sokoban_deadlock)
+    final, stats = se.search(costbound=(math.inf, math.inf, math.inf), deadline=deadline)
     return final, stats  # CHANGE THIS
 
-def iterative_astar(initial_state, heur_fn, weight=1, timebound=5):  # uses f(n), see how autograder initializes a search line 88
+def iterative_astar(initial_state, heur_fn, weight=1, timebound=5, deadline=None):  # uses f(n), see how autograder initializes a search line 88
     # IMPLEMENT
     '''Provides an implementation of realtime a-star, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state, a timebound (number of seconds) and optionally
+    a deadline shared with the caller (see search_deadline)'''
     '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
-    '''implementation of iterative astar algorithm'''
-    end_time = os.times()[4] + timebound
+    '''implementation of iterative astar algorithm: anytime weighted a star (ARA*). after each solution the
+    weight is halved and the search resumes from its OPEN list, pruning nodes that can not do better'''
+    deadline = search_deadline(timebound, deadline)
 
+    # anytime_search orders nodes by g + weight * h itself, so no fval_function is needed
     se = SearchEngine('custom', 'full')
-    wrapped_fval_function = lambda sN: fval_function(sN, weight)
-    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=wrapped_fval_function)
-    time_left = end_time - os.times()[4]
-    best_result = 0
-    first_search = True
-    best_gval = math.inf
-    
-    while (time_left>0):
-        #update cost[2] for iterative a* with gval
-        found, stats = se.search(timebound = time_left, costbound=(math.inf, math.inf, best_gval))
-        weight = weight * 0.5
-        if found == False:
-            if (first_search):
-                return found, stats
-        else:
-            if (best_gval > found.gval):
-                best_gval = found.gval
-                best_result = found, stats
-        first_search = False
-        time_left = end_time - os.times()[4]
-    return best_result[0], best_result[1] #CHANGE THIS
-
-def iterative_gbfs(initial_state, heur_fn, timebound=5):  # only use h(n)
+    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, prune_fn=sokoban_deadlock)
+    return se.anytime_search(weight, weight_decay=0.5, deadline=deadline)
+
+def iterative_gbfs(initial_state, heur_fn, timebound=5, deadline=None):  # only use h(n)
     # IMPLEMENT
     '''Provides an implementation of anytime greedy best-first search, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state, a timebound (number of seconds) and optionally
+    a deadline shared with the caller (see search_deadline)'''
     '''OUTPUT: A goal state (if a goal is found), else False'''
-    '''implementation of iterative gbfs algorithm'''
-    end_time = os.times()[4] + timebound
+    '''implementation of iterative gbfs algorithm: after each solution the search resumes from its OPEN list,
+    pruning nodes whose gval is no better than the best solution'''
+    deadline = search_deadline(timebound, deadline)
 
     se = SearchEngine('best_first', "full")
-    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=fval_function)
-    best_gval = math.inf
-    time_left = end_time - os.times()[4]
-    best_result = 0
-    first_search = True
-
-    while (time_left>0):
-        #update cost[0] for gbfs with gval
-        found, stats = se.search(timebound=time_left, costbound=(best_gval, math.inf, math.inf))
-        if found == False:
-            if(first_search):
-                return found, stats
-        else:
-            if (best_gval > found.gval):
-                best_gval = found.gval
-                best_result = found, stats
-        first_search = False
-        time_left = end_time - os.times()[4]
-    return best_result[0], best_result[1] #CHANGE THIS
+    se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=fval_function,
+                   prune_fn=sokoban_deadlock)
+    return se.anytime_search(None, deadline=deadline)
+
+def bidirectional(initial_state, timebound=5, deadline=None):
+    '''Provides a bidirectional breadth-first search: forward from the start state, backward by pulling boxes
+    away from the storage points'''
+    '''INPUT: a sokoban state that represents the start state, a timebound (number of seconds) and optionally
+    a deadline shared with the caller (see search_deadline)'''
+    '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
+    '''the two searches meet on a box configuration, then the pushes of the backward half are replayed forward.
+    the solution is valid but not necessarily the cheapest'''
+    deadline = search_deadline(timebound, deadline)
+
+    se = SearchEngine('breadth_first', 'full')
+    se.init_search(initial_state, goal_fn=sokoban_goal_state, prune_fn=sokoban_deadlock)
+    return se.bidirectional_search(sokoban_pull_start_states(initial_state), sokoban_box_key, sokoban_join,
+                                   deadline=deadline)
 
 def mahattan_distance(box, storage):
     '''calculate mahattan distance between box and storage'''
@@ -262,17 +536,6 @@ def mahattan_distance(box, storage):
     return distance       
 
 
-def wall_corner_deadlock(box, state):
-    '''calculate if current location is one of the corners'''
-    '''INPUT: box, state'''
-    '''OUTPUT: true or false'''
-    corner_positions = [(0,0), (0,state.height-1), (state.width-1, 0), (state.width-1, state.height-1)]
-
-    if box in corner_positions:
-        return True
-        # Enhanced obstacle and edge consideration
-    return False
-
 def horizontal_deadlock(box, state, avaliable_storage):
     '''determine if there is a wall on the left or right side of the box and there is no avaliable storage on the column'''
     '''INPUT: box, state, avaliable storage'''
@@ -298,45 +561,3 @@ def vertical_deadlock(box, state, avaliable_storage):
         if (not(any(st[1] == state.height-1 for st in avaliable_storage))):
             return True
     return False
-
-def obstacle_count(box, position, state):
-    '''determine the distance from robot to box. consider obstacle + 2 in steps. if there is no obstacle get from 
-    (0,0) to (0,2) in 2 steps. if there is obstacle at (0,1), need 4 steps to go from (0,0) to (1,0) and 
-    (1,0) to (1,1), (1,1) to (1,2), (1,2) to (0,2). so when there is obstacle, step +2.'''
-    '''INPUT: box, postition, state'''
-    '''OUTPUT: number of more steps because of obstacle'''
-    obstacle_list = list(state.boxes) + list(state.obstacles) + list(state.robots)
-
-    if (box in obstacle_list):
-        obstacle_list.remove(box)
-
-    if (position in obstacle_list):
-        obstacle_list.remove(position)
-
-    m_path = manhattan_path(box, position)
-    obstacle_count = sum (2 for element in m_path if element in obstacle_list)
-    return obstacle_count
-
-def manhattan_path(position1, position2):
-    '''return a list of every point on the manhattan path'''
-    '''INPUT: point1, point2'''
-    '''OUTPUT: list of points on the path'''
-    path = [position1]
-
-    if (position2[0]> position1[0]):
-        dir_x = 1
-    else:
-        dir_x = -1
-    
-    if (position2[1]> position1[1]):
-        dir_y = 1
-    else:
-        dir_y = -1
-
-    for x in range(position1[0], position2[0], dir_x):
-        path.append((x + dir_x, position1[1]))
-
-    for y in range(position1[1], position2[1], dir_y):
-        path.append((position2[0], y + dir_y))
-
-    return path
\ No newline at end of file
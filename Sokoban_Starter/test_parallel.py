@@ -0,0 +1,34 @@
+'''Tests of the parallel solving routines. Run them with
+        python -m pytest test_parallel.py
+'''
+
+import time
+import threading
+import multiprocessing
+from parallel import solve_batch
+from sokoban import PROBLEMS
+
+
+def test_solve_batch_closed_early():
+    # closing the generator after the first result must stop the tasks that are still running,
+    # without errors in any of the pool's threads
+    errors = []
+    old_hook = threading.excepthook
+    threading.excepthook = errors.append
+    try:
+        started = time.monotonic()
+        results = solve_batch(PROBLEMS[:6], timebound=10, max_workers=2)
+        i, final, stats = next(results)
+        assert 0 <= i < 6
+        results.close()
+        assert time.monotonic() - started < 10
+        assert not multiprocessing.active_children()
+    finally:
+        threading.excepthook = old_hook
+    assert not errors
+
+
+def test_solve_batch_all_results():
+    results = list(solve_batch(PROBLEMS[:4], timebound=2, max_workers=2))
+    assert sorted(i for i, _, _ in results) == [0, 1, 2, 3]
+    assert all(stats.states_expanded > 0 for _, _, stats in results)
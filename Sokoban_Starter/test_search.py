@@ -0,0 +1,116 @@
+'''Tests of the search engine and its data structures. Run them with
+        python -m pytest test_search.py
+'''
+
+import gc
+import math
+import time
+import random
+from search import SearchEngine, CompactClosedTable
+from sokoban import PROBLEMS, sokoban_goal_state
+from solution import heur_min_matching, sokoban_deadlock
+
+
+def compare_with_dict(keys, rounds, seed):
+    '''Applies the same random operations to a CompactClosedTable and a dict, checking they agree after each one.'''
+    rnd = random.Random(seed)
+    table = CompactClosedTable(capacity=4)
+    expected = dict()
+    for _ in range(rounds):
+        key = rnd.choice(keys)
+        stored = key & CompactClosedTable._KEY_MASK
+        if rnd.random() < 0.5:
+            gval = rnd.randrange(2 ** 32)
+            table[key] = gval
+            expected[stored] = gval
+        assert (key in table) == (stored in expected)
+        assert table.get(key) == expected.get(stored)
+        assert table.get(key, -1) == expected.get(stored, -1)
+        if stored in expected:
+            assert table[key] == expected[stored]
+        else:
+            try:
+                table[key]
+                assert False, 'missing key %d found' % key
+            except KeyError:
+                pass
+        assert len(table) == len(expected)
+    for stored, gval in expected.items():
+        assert table[stored] == gval
+
+
+def test_compact_closed_table_random_keys():
+    rnd = random.Random(1)
+    keys = [rnd.getrandbits(64) - (1 << 63) for _ in range(2000)]
+    compare_with_dict(keys, 20000, 2)
+
+
+def test_compact_closed_table_colliding_keys():
+    # keys that share their low bits all probe from the same slot
+    keys = [i << 40 for i in range(300)] + [(i << 40) + 1 for i in range(300)]
+    compare_with_dict(keys, 5000, 3)
+
+
+def test_compact_closed_table_zero_key():
+    # 0 marks an empty slot, so it must not be confused with 1 (or 2 ** 64, which reduces to 0)
+    keys = [0, 1, 2, -1, 1 << 64, (1 << 64) + 1]
+    compare_with_dict(keys, 2000, 4)
+    table = CompactClosedTable()
+    table[0] = 5
+    assert 1 not in table and table.get(1) is None
+    table[1] = 7
+    assert table[0] == 5 and table[1 << 64] == 5 and table[1] == 7 and len(table) == 2
+
+
+def test_sma_memory_bound_stays_optimal():
+    # budgets near the size of the lowest f-value layers, where SMA* must drop and regenerate nodes
+    for problem, budget, cost in ((2, 2000, 21), (7, 200, 41)):
+        for open_type in ('heap', 'indexed', 'bucket'):
+            se = SearchEngine('astar', 'full', open_type)
+            se.set_memory_bound(budget, 'sma')
+            se.init_search(PROBLEMS[problem], sokoban_goal_state, heur_min_matching, prune_fn=sokoban_deadlock)
+            goal, stats = se.search(timebound=20)
+            assert goal and goal.gval == cost, (problem, budget, open_type)
+
+
+def test_ida_star_resumes():
+    se = SearchEngine('ida_star', 'full')
+    se.init_search(PROBLEMS[4], sokoban_goal_state, heur_min_matching, prune_fn=sokoban_deadlock)
+    # a deadline that has passed stops the search at its first check
+    goal, stats = se.search(deadline=time.monotonic())
+    assert goal is False
+    goal, stats = se.search(timebound=20)
+    assert goal and goal.gval == 8
+    # resuming past the goal finds no cheaper solution, and then nothing more
+    goal, stats = se.search(timebound=20, costbound=(7, math.inf, 7))
+    assert goal is False
+    goal, stats = se.search(timebound=20)
+    assert goal is False
+
+
+def test_timed_search_restores_gc():
+    # a search with a deadline pauses the garbage collector, and must turn it back on however it returns
+    def failing_heuristic(state):
+        if state.gval > 2:
+            raise ValueError('heuristic failed')
+        return 0
+
+    assert gc.isenabled()
+    se = SearchEngine('astar', 'full')
+    se.init_search(PROBLEMS[4], sokoban_goal_state, heur_min_matching)
+    goal, stats = se.search(timebound=20)
+    assert goal and gc.isenabled()
+    se.init_search(PROBLEMS[4], sokoban_goal_state, failing_heuristic)
+    try:
+        se.search(timebound=20)
+        assert False, 'the heuristic did not raise'
+    except ValueError:
+        pass
+    assert gc.isenabled()
+    gc.disable()
+    try:
+        se.init_search(PROBLEMS[4], sokoban_goal_state, heur_min_matching)
+        se.search(timebound=20)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
@@ -0,0 +1,87 @@
+'''Tests of the Sokoban state spaces. Run them with
+        python -m pytest test_sokoban.py
+'''
+
+import random
+import pytest
+from search import SearchEngine
+from sokoban import PROBLEMS, BitboardSokobanState, PooledSokobanState, SokobanPushState, SokobanState
+from sokoban import sokoban_goal_state
+
+
+def same_state(state, other):
+    return (state.robots == other.robots and state.boxes == other.boxes and state.gval == other.gval and
+            state.action == other.action)
+
+
+def path(state):
+    states = []
+    while state is not None:
+        states.append(state)
+        state = state.parent
+    return states
+
+
+def compare_walk(problem, steps, seed, symmetric_robots=False):
+    '''
+    Walks randomly through the SokobanState space of problem and, in step, through its bitboard and pooled
+    versions, checking after each step that they generate the same successors, that the incrementally
+    updated Zobrist hashes are those computed from scratch and tell the same states apart as the original
+    hashable_state, and that the pool rebuilds the same path.
+    '''
+    rnd = random.Random(seed)
+    state = SokobanState(problem.action, problem.gval, None, problem.width, problem.height, problem.robots,
+                         problem.boxes, problem.storage, problem.obstacles, symmetric_robots)
+    bitboard = BitboardSokobanState.from_state(state, symmetric_robots=symmetric_robots)
+    pooled = PooledSokobanState.from_state(state, symmetric_robots=symmetric_robots)
+    level = bitboard.level
+    hashes = dict()
+    for _ in range(steps):
+        successors = state.successors()
+        bitboard_successors = bitboard.successors()
+        pooled_successors = pooled.successors()
+        assert len(successors) == len(bitboard_successors) == len(pooled_successors)
+        for succ, bitboard_succ, pooled_succ in zip(successors, bitboard_successors, pooled_successors):
+            assert same_state(succ, bitboard_succ) and same_state(succ, pooled_succ)
+            zobrist = level.zobrist(bitboard_succ.robot_cells, bitboard_succ.box_mask, symmetric_robots)
+            assert bitboard_succ.hashable_state() == pooled_succ.hashable_state() == zobrist
+            assert hashes.setdefault(succ.hashable_state(), zobrist) == zobrist
+            assert pooled_succ.has_path_cycle() == succ.has_path_cycle()
+        if not successors:
+            break
+        i = rnd.randrange(len(successors))
+        state, bitboard, pooled = successors[i], bitboard_successors[i], pooled_successors[i]
+    assert len(set(hashes.values())) == len(hashes)
+    assert all(map(same_state, path(state), path(pooled)))
+
+
+def test_bitboard_and_pooled_successors():
+    for i, problem in enumerate(PROBLEMS):
+        compare_walk(problem, 150, i)
+
+
+def test_bitboard_and_pooled_successors_symmetric_robots():
+    for i, problem in enumerate(PROBLEMS):
+        if len(problem.robots) > 1:
+            compare_walk(problem, 150, i, symmetric_robots=True)
+
+
+def optimal_goal(state):
+    se = SearchEngine('astar', 'full')
+    se.init_search(state, sokoban_goal_state, lambda state: 0)
+    goal, stats = se.search(timebound=10)
+    return goal
+
+
+def test_push_level_costs():
+    for problem in (PROBLEMS[2], PROBLEMS[21]):
+        goal = optimal_goal(SokobanPushState.from_state(problem))
+        assert goal.gval == optimal_goal(BitboardSokobanState.from_state(problem)).gval
+        step = goal.step_path()
+        assert step.gval == goal.gval and sokoban_goal_state(step)
+
+
+def test_push_level_refuses_several_robots():
+    assert len(PROBLEMS[0].robots) > 1
+    with pytest.raises(ValueError):
+        SokobanPushState.from_state(PROBLEMS[0])
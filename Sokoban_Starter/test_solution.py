@@ -0,0 +1,91 @@
+'''Tests of the heuristics and deadlock detection. Run them with
+        python -m pytest test_solution.py
+'''
+
+import gc
+import math
+import random
+import itertools
+import solution
+from search import SearchEngine
+from sokoban import PROBLEMS, BitboardSokobanState, SokobanLevel, sokoban_goal_state
+
+
+def astar(problem, heur_fn, prune_fn=None):
+    se = SearchEngine('astar', 'full')
+    se.init_search(problem, sokoban_goal_state, heur_fn, prune_fn=prune_fn)
+    goal, stats = se.search(timebound=10)
+    return goal
+
+
+def brute_force_matching(level, box_mask):
+    '''The cost of the cheapest assignment of the boxes to distinct storage points, trying every one.'''
+    boxes = [cell for cell in range(level.width * level.height) if box_mask >> cell & 1]
+    best = math.inf
+    for storage in itertools.permutations(range(len(level.push_distances)), len(boxes)):
+        best = min(best, sum(level.push_distances[point][box] for point, box in zip(storage, boxes)))
+    return best
+
+
+def random_box_mask(level, free_cells, count, rnd):
+    return sum(1 << cell for cell in rnd.sample(free_cells, count))
+
+
+def test_deadlock_pruning_keeps_optimal_costs():
+    # sokoban_deadlock must only prune states from which no goal can be reached
+    for problem in (PROBLEMS[2], PROBLEMS[3], PROBLEMS[4], PROBLEMS[6], PROBLEMS[7], PROBLEMS[20], PROBLEMS[21]):
+        pruned = astar(problem, solution.heur_min_matching, solution.sokoban_deadlock)
+        unpruned = astar(problem, solution.heur_min_matching)
+        assert pruned and unpruned and pruned.gval == unpruned.gval
+        state = unpruned
+        while state is not None:
+            assert not solution.sokoban_deadlock(state)
+            state = state.parent
+
+
+def test_matching_against_brute_force():
+    rnd = random.Random(5)
+    for problem in PROBLEMS:
+        level = SokobanLevel.of(problem)
+        free_cells = [cell for cell in range(level.width * level.height) if not level.obstacle_mask >> cell & 1]
+        box_mask = random_box_mask(level, free_cells, len(problem.boxes), rnd)
+        matching = solution.BoxMatching(level, box_mask)
+        for _ in range(20):
+            assert matching.total_cost() == brute_force_matching(level, box_mask)
+            assert solution.BoxMatching(level, box_mask).total_cost() == matching.total_cost()
+            # move a single box, repairing the matching incrementally
+            old_cell = rnd.choice([cell for cell in free_cells if box_mask >> cell & 1])
+            new_cell = rnd.choice([cell for cell in free_cells if not box_mask >> cell & 1])
+            box_mask = box_mask ^ (1 << old_cell) ^ (1 << new_cell)
+            matching = matching.moved(box_mask)
+
+
+def test_matching_heuristic_along_random_walks(monkeypatch):
+    monkeypatch.setattr(solution, 'matching_cache', {})
+    rnd = random.Random(6)
+    heuristic = solution.MatchingHeuristic()
+    for problem in PROBLEMS:
+        state = BitboardSokobanState.from_state(problem)
+        hval, hinfo = heuristic.initial(state)
+        for _ in range(100):
+            assert hval == solution.heur_min_matching(state) == brute_force_matching(state.level, state.box_mask)
+            successors = state.successors()
+            if not successors:
+                break
+            succ = rnd.choice(successors)
+            hval, hinfo = heuristic.update(succ, state, hinfo)
+            state = succ
+
+
+def test_matching_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(solution, 'MATCHING_CACHE_SIZE', 100)
+    monkeypatch.setattr(solution, 'matching_cache', {})
+    se = SearchEngine('astar', 'full')
+    se.init_search(PROBLEMS[2], sokoban_goal_state, solution.heur_min_matching)
+    goal, stats = se.search(timebound=10)
+    assert goal and goal.gval == 21
+    assert len(solution.matching_cache) == 100
+    # neither the keys nor the matchings keep levels alive
+    for key, matching in solution.matching_cache.items():
+        assert not any(isinstance(item, SokobanLevel) for item in key[0])
+        assert not any(isinstance(item, SokobanLevel) for item in gc.get_referents(matching.__dict__))
@@ -42,12 +42,21 @@ def parse_state_string(state_string):
   return SokobanState("START", 0, None, width, height, tuple(robots), boxes, storage, obstacles)
 
 
+def state_items(state):
+  # states keep their data in __slots__ (and the static part in state.level), not in a __dict__
+  for cls in type(state).__mro__:
+    for k in getattr(cls, '__slots__', ()):
+      if hasattr(state, k):
+        yield k, getattr(state, k)
+  for k in ('width', 'height', 'storage', 'obstacles'):
+    yield k, getattr(state, k)
+
 def test():
   s = PROBLEMS[0]
   s2 = parse_state_string(s.state_string())
-  for k,v in s.__dict__.items():
+  for k,v in state_items(s):
     print(k,v)
-  for k,v in s2.__dict__.items():
+  for k,v in state_items(s2):
     print(k,v)
   print(s2.state_string() ==s.state_string())
 def verify_inverse(s):
@@ -102,9 +111,9 @@ def VERIFY():
       print()
       s2 = parse_state_string(s.state_string())
       print(s2.state_string())
-      for k,v in s.__dict__.items():
+      for k,v in state_items(s):
         print(k,v)
-      for k,v in s2.__dict__.items():
+      for k,v in state_items(s2):
         print(k,v)
   print(result_list)
 